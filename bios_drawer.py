@@ -2,6 +2,8 @@
 
 from PIL import Image, ImageDraw, ImageFont
 import datetime
+import time
+from graphics_engine import blit_text, cached_truetype
 
 # --- Конфигурация для 320x240 ---
 DEFAULT_BIOS_RESOLUTION = (320, 240)
@@ -27,7 +29,7 @@ def _load_font(font_path=SMALL_FONT_PATH, font_size=SMALL_FONT_SIZE):
         # Для очень маленьких размеров может потребоваться встроенный растровый шрифт PIL
         # если TTF выглядит плохо. Раскомментируйте строку ниже, если нужно.
         # if font_size <= 8: return ImageFont.load_default()
-        return ImageFont.truetype(font_path, font_size)
+        return cached_truetype(font_path, font_size)
     except IOError:
         print(f"Предупреждение: Шрифт '{font_path}' не найден. Используется шрифт PIL по умолчанию.")
         return ImageFont.load_default()
@@ -36,96 +38,126 @@ def _load_font(font_path=SMALL_FONT_PATH, font_size=SMALL_FONT_SIZE):
          return ImageFont.load_default()
 
 
-def draw_bios_on_image(target_image):
-    """
-    Рисует упрощенный статический BIOS-интерфейс на объекте Pillow Image
-    размером 320x240.
+# --- Шрифт и раскладка экрана зависят только от шрифта, считаем их один раз при импорте ---
+_FONT = _load_font()
 
-    Args:
-        target_image (PIL.Image.Image): Объект Pillow Image размером 320x240.
-                                         Будет изменен на месте.
-    Returns:
-        PIL.Image.Image: Измененный target_image.
-    """
-    if target_image.size != DEFAULT_BIOS_RESOLUTION:
-        print(f"Предупреждение: Размер изображения {target_image.size} не равен {DEFAULT_BIOS_RESOLUTION}. Результат может быть некорректным.")
-        # Можно добавить обрезку или масштабирование, если нужно:
-        # target_image = target_image.crop((0, 0, SMALL_BIOS_RESOLUTION[0], SMALL_BIOS_RESOLUTION[1]))
+# Определение высоты строки на основе шрифта
+try:
+    # Попытка получить высоту символа 'A' для оценки строки
+    _LINE_H = _FONT.getbbox("A")[3] + 4 # Высота символа + небольшой отступ
+except AttributeError:
+    # У старых или стандартных шрифтов может не быть getbbox
+    _LINE_H = _FONT.getsize("A")[1] + 4
 
-    draw = ImageDraw.Draw(target_image)
-    font = _load_font()
+_TITLE_TEXT = "BIOS SETUP"
+_TITLE_BBOX = _FONT.getbbox(_TITLE_TEXT)
+_TITLE_Y = 5 # Ближе к верху
+_MENU_Y_START = _TITLE_Y + _LINE_H + 2 # Сразу под заголовком
+_MENU_Y_END = _MENU_Y_START + _LINE_H # Только одна строка меню
+_CONTENT_Y_START = _MENU_Y_END + _LINE_H # Отступ от меню
+_CONTENT_X_LABEL = 10
+_CONTENT_X_VALUE = 100 # Где начинаются значения
 
-    width, height = target_image.size
-    x_offset, y_offset = 0, 0 # Рисуем прямо на изображении
+# Время и Дата: подписи и префикс ": [" статичны, сами значения рисуются каждый кадр
+_VALUE_PREFIX = ": ["
+_TIME_VALUE_XY = (_CONTENT_X_VALUE + int(_FONT.getlength(_VALUE_PREFIX)), _CONTENT_Y_START + _LINE_H * 0)
+_DATE_VALUE_XY = (_CONTENT_X_VALUE + int(_FONT.getlength(_VALUE_PREFIX)), _CONTENT_Y_START + _LINE_H * 1)
 
-    # Определение высоты строки на основе шрифта
-    try:
-        # Попытка получить высоту символа 'A' для оценки строки
-        line_height = font.getbbox("A")[3] + 4 # Высота символа + небольшой отступ
-    except AttributeError:
-         # У старых или стандартных шрифтов может не быть getbbox
-         line_height = font.getsize("A")[1] + 4
-
-    # --- Начинаем рисование ---
-
-    # 1. Фон
-    draw.rectangle(
-        [x_offset, y_offset, x_offset + width, y_offset + height],
-        fill=COLORS["background"]
-    )
 
-    # 2. Заголовок (укороченный)
-    title = "BIOS SETUP"
-    title_bbox = draw.textbbox((0,0), title, font=font)
-    title_width = title_bbox[2] - title_bbox[0]
-    draw.text(
-        (x_offset + (width - title_width) // 2, y_offset + 5), # Ближе к верху
-        title,
-        fill=COLORS["foreground"],
-        font=font
-    )
+def _build_bios_template(size):
+    """Рисует все неизменяемые элементы BIOS-экрана размера size (ширина, высота) на отдельном изображении."""
+    font = _FONT
+    template = Image.new("RGB", size, COLORS["background"])
+    draw = ImageDraw.Draw(template)
+    width, height = size
+
+    # 1. Фон уже залит при создании шаблона
+
+    # 2. Заголовок (укороченный), по центру ширины
+    title_x = (width - (_TITLE_BBOX[2] - _TITLE_BBOX[0])) // 2
+    draw.text((title_x, _TITLE_Y), _TITLE_TEXT, fill=COLORS["foreground"], font=font)
 
     # 3. Меню (укороченное)
-    menu_y_start = y_offset + 5 + line_height + 2 # Сразу под заголовком
-    menu_y_end = menu_y_start + line_height # Только одна строка меню
-    draw.rectangle(
-        [x_offset, menu_y_start, x_offset + width, menu_y_end],
-        fill=COLORS["highlight_bg"]
-    )
+    # Заливка через paste идет по быстрому пути Pillow (box не включает правую/нижнюю границу)
+    template.paste(COLORS["highlight_bg"], (0, _MENU_Y_START, width, _MENU_Y_END + 1))
     # Укороченные пункты и меньше пробелов
     menu_items = " Main    Advanced    Boot    Exit "
     draw.text(
-        (x_offset + 5, menu_y_start + 2), # Отступ слева и небольшой по вертикали
+        (5, _MENU_Y_START + 2), # Отступ слева и небольшой по вертикали
         menu_items,
         fill=COLORS["highlight_fg"],
         font=font
     )
 
     # 4. Основной контент (сильно сокращен)
-    content_y_start = menu_y_end + line_height # Отступ от меню
-    content_x_label = x_offset + 10
-    content_x_value = x_offset + 100 # Где начинаются значения
-
-    # Время и Дата
-    now = datetime.datetime.now()
-    draw.text((content_x_label, content_y_start + line_height * 0), "Time", fill=COLORS["label"], font=font)
-    draw.text((content_x_value, content_y_start + line_height * 0), f": [{now.strftime('%H:%M:%S')}]", fill=COLORS["foreground"], font=font)
-    draw.text((content_x_label, content_y_start + line_height * 1), "Date", fill=COLORS["label"], font=font)
-    draw.text((content_x_value, content_y_start + line_height * 1), f": [{now.strftime('%m/%d/%y')}]", fill=COLORS["foreground"], font=font) # Короткий формат даты
+    time_y = _TIME_VALUE_XY[1]
+    date_y = _DATE_VALUE_XY[1]
+    draw.text((_CONTENT_X_LABEL, time_y), "Time", fill=COLORS["label"], font=font)
+    draw.text((_CONTENT_X_VALUE, time_y), _VALUE_PREFIX, fill=COLORS["foreground"], font=font)
+    draw.text((_CONTENT_X_LABEL, date_y), "Date", fill=COLORS["label"], font=font)
+    draw.text((_CONTENT_X_VALUE, date_y), _VALUE_PREFIX, fill=COLORS["foreground"], font=font)
 
     # Пример другой информации
-    draw.text((content_x_label, content_y_start + line_height * 3), "BIOS Ver", fill=COLORS["label"], font=font)
-    draw.text((content_x_value, content_y_start + line_height * 3), ": 1.0a", fill=COLORS["foreground"], font=font)
-    draw.text((content_x_label, content_y_start + line_height * 4), "Memory", fill=COLORS["label"], font=font)
-    draw.text((content_x_value, content_y_start + line_height * 4), ": 1024MB", fill=COLORS["foreground"], font=font)
+    draw.text((_CONTENT_X_LABEL, _CONTENT_Y_START + _LINE_H * 3), "BIOS Ver", fill=COLORS["label"], font=font)
+    draw.text((_CONTENT_X_VALUE, _CONTENT_Y_START + _LINE_H * 3), ": 1.0a", fill=COLORS["foreground"], font=font)
+    draw.text((_CONTENT_X_LABEL, _CONTENT_Y_START + _LINE_H * 4), "Memory", fill=COLORS["label"], font=font)
+    draw.text((_CONTENT_X_VALUE, _CONTENT_Y_START + _LINE_H * 4), ": 1024MB", fill=COLORS["foreground"], font=font)
 
     # Убираем боковую панель помощи, так как места нет
 
     # 5. Нижняя строка (минимальная информация)
-    bottom_y = y_offset + height - line_height # Прямо у нижнего края
     bottom_text = "F1:Help  F10:Save   ESC:Exit"
-    draw.text((x_offset + 10, bottom_y), bottom_text, fill=COLORS["foreground"], font=font)
+    draw.text((10, height - _LINE_H), bottom_text, fill=COLORS["foreground"], font=font) # Прямо у нижнего края
+
+    return template
+
+
+# Шаблоны статичной части экрана: (ширина, высота) -> изображение; строятся при первой отрисовке такого размера
+_BIOS_TEMPLATES = {}
+
+
+def _get_bios_template(size):
+    """Возвращает шаблон для размера size, рисуя его при первом обращении."""
+    template = _BIOS_TEMPLATES.get(size)
+    if template is None:
+        template = _BIOS_TEMPLATES[size] = _build_bios_template(size)
+    return template
+
+# Последние отформатированные строки времени/даты: (секунда, "HH:MM:SS]", "mm/dd/yy]").
+# Экран показывает время с точностью до секунды, поэтому strftime нужен не чаще раза в секунду.
+_last_ts = (None, None, None)
+
+
+def draw_bios_on_image(target_image):
+    """
+    Рисует упрощенный статический BIOS-интерфейс на объекте Pillow Image
+    размером 320x240.
+
+    Неизменяемая часть экрана берется из заранее отрисованного шаблона,
+    на каждом вызове дорисовываются только текущие время и дата.
+
+    Args:
+        target_image (PIL.Image.Image): Объект Pillow Image размером 320x240.
+                                         Будет изменен на месте.
+    Returns:
+        PIL.Image.Image: Измененный target_image.
+    """
+    # Проверка размера нужна только при отладке; с python -O она вырезается целиком
+    if __debug__ and target_image.size != DEFAULT_BIOS_RESOLUTION:
+        print(f"Предупреждение: Размер изображения {target_image.size} не равен {DEFAULT_BIOS_RESOLUTION}. Результат может быть некорректным.")
+        # Можно добавить обрезку или масштабирование, если нужно:
+        # target_image = target_image.crop((0, 0, SMALL_BIOS_RESOLUTION[0], SMALL_BIOS_RESOLUTION[1]))
+
+    # Шаблон целиком перекрывает предыдущий кадр, поэтому старые цифры не "просвечивают"
+    target_image.paste(_get_bios_template(target_image.size))
 
-    # --- Конец рисования ---
+    # Цифры и разделители берутся из кэша растеризованных глифов
+    global _last_ts
+    sec = int(time.time())
+    if sec != _last_ts[0]:
+        now = datetime.datetime.fromtimestamp(sec)
+        _last_ts = (sec, f"{now.strftime('%H:%M:%S')}]", f"{now.strftime('%m/%d/%y')}]") # Короткий формат даты
+    blit_text(target_image, _TIME_VALUE_XY, _last_ts[1], _FONT, COLORS["foreground"])
+    blit_text(target_image, _DATE_VALUE_XY, _last_ts[2], _FONT, COLORS["foreground"])
 
-    return target_image # Возвращаем измененное изображение
\ No newline at end of file
+    return target_image # Возвращаем измененное изображение
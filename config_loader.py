@@ -1,18 +1,78 @@
 import yaml
 import os
+from collections import OrderedDict
 from copy import deepcopy # Для глубокого копирования
 
+# C-реализация загрузчика (libyaml) заметно быстрее чисто Python-версии, если доступна
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader
+
 DEFAULT_CONFIG_FILE_PATH = 'config.yaml'
 
+# Кэш разобранных YAML файлов: абсолютный путь -> (mtime, размер, сырой словарь).
+# Запись считается актуальной, пока у файла не изменились mtime и размер.
+_YAML_CACHE: "OrderedDict[str, tuple[float, int, dict]]" = OrderedDict()
+_YAML_CACHE_MAX = 100
+
 def load_raw_config_from_file(config_path=DEFAULT_CONFIG_FILE_PATH):
-    """Загружает "сырую" конфигурацию из YAML файла."""
+    """
+    Загружает "сырую" конфигурацию из YAML файла.
+    Повторные вызовы для неизменившегося файла отдают копию из кэша без разбора YAML.
+    """
     if not os.path.exists(config_path):
         raise FileNotFoundError(f"Файл конфигурации не найден: {config_path}")
+
+    st = os.stat(config_path)
+    key = os.path.abspath(config_path)
+    entry = _YAML_CACHE.get(key)
+    if entry is not None and entry[0] == st.st_mtime and entry[1] == st.st_size:
+        _YAML_CACHE.move_to_end(key)
+        return deepcopy(entry[2]) # Копия, чтобы вызывающий код не испортил кэш
+
     with open(config_path, 'r', encoding='utf-8') as f:
-        raw_config = yaml.safe_load(f)
+        raw_config = yaml.load(f, Loader=_SafeLoader)
     if raw_config is None: # Если файл пустой
         raw_config = {}
-    return raw_config
+
+    _YAML_CACHE[key] = (st.st_mtime, st.st_size, raw_config)
+    _YAML_CACHE.move_to_end(key)
+    while len(_YAML_CACHE) > _YAML_CACHE_MAX:
+        _YAML_CACHE.popitem(last=False)
+    return deepcopy(raw_config)
+
+# Ключи, значения которых являются цветами (списки RGB/RGBA из YAML -> кортежи)
+_COLOR_KEYS = frozenset({
+    'color', 'color_read', 'color_write',
+    'background', 'foreground', 'value_color', 'graph_line',
+    'grid_lines', 'cell_border', 'error', 'label', 'highlight_bg', 'highlight_fg',
+})
+
+def _convert_colors_to_tuples(conf, pipeline_name, path='', all_colors=False):
+    """
+    Рекурсивно обходит словарь конфигурации и преобразует списки цветов в кортежи.
+    Цветом считается значение под ключом из _COLOR_KEYS, а также любое значение
+    внутри словаря, чье имя оканчивается на '_colors' (например, prometheus_colors).
+    """
+    for key, value in conf.items():
+        if isinstance(value, dict):
+            _convert_colors_to_tuples(value, pipeline_name, f"{path}{key}.",
+                                      all_colors=isinstance(key, str) and key.endswith('_colors'))
+        elif isinstance(value, list) and (all_colors or key in _COLOR_KEYS):
+            if len(value) in (3, 4): # Проверка на RGB или RGBA
+                conf[key] = tuple(value)
+            else:
+                print(f"[WARN][ConfigLoader] Некорректная длина цвета для '{path}{key}' пайплайна '{pipeline_name}': {value}. Цвет не будет преобразован.")
+
+def _copy_dicts(value):
+    """
+    Копирует только словари (рекурсивно): их изменяют на месте слияние и _convert_colors_to_tuples.
+    Списки и скаляры на месте не меняются (цвета заменяются кортежами), поэтому остаются общими.
+    """
+    if isinstance(value, dict):
+        return {k: _copy_dicts(v) for k, v in value.items()}
+    return value
 
 def process_configs(raw_config):
     """
@@ -23,14 +83,17 @@ def process_configs(raw_config):
     processed_pipelines_list = []
 
     for p_conf_override in raw_config.get('pipelines', []):
-        final_pipeline_conf = deepcopy(default_pipeline_settings)
+        # Поверхностное слияние; собственные копии получают только вложенные словари (например, записи
+        # prometheus_metric_config): они изменяются на месте при слиянии и в _convert_colors_to_tuples
+        # и не должны разделяться между пайплайнами, настройками по умолчанию и исходным raw_config.
+        final_pipeline_conf = _copy_dicts(default_pipeline_settings)
 
         # "Умное" слияние словарей
         for key, value in p_conf_override.items():
+            value = _copy_dicts(value)
             if isinstance(value, dict) and key in final_pipeline_conf and isinstance(final_pipeline_conf[key], dict):
-                merged_dict = deepcopy(final_pipeline_conf[key])
-                merged_dict.update(value)
-                final_pipeline_conf[key] = merged_dict
+                # Словарь уже скопирован выше и принадлежит только этому пайплайну
+                final_pipeline_conf[key].update(value)
             else:
                 final_pipeline_conf[key] = value
 
@@ -56,24 +119,8 @@ def process_configs(raw_config):
                       final_pipeline_conf['wb_scale'] = (1.0, 1.0, 1.0)
 
 
-        # 2. Цвета в словаре prometheus_colors (если есть)
-        if 'prometheus_colors' in final_pipeline_conf and isinstance(final_pipeline_conf['prometheus_colors'], dict):
-            for color_key, color_value in final_pipeline_conf['prometheus_colors'].items():
-                if isinstance(color_value, list) and len(color_value) in [3, 4]: # Проверка на RGB или RGBA
-                    final_pipeline_conf['prometheus_colors'][color_key] = tuple(color_value)
-
-        # 3. Цвета внутри prometheus_metric_config (если есть) - ИСПРАВЛЕНИЕ ЗДЕСЬ
-        if 'prometheus_metric_config' in final_pipeline_conf and isinstance(final_pipeline_conf['prometheus_metric_config'], dict):
-            for metric_key, metric_details in final_pipeline_conf['prometheus_metric_config'].items():
-                if isinstance(metric_details, dict):
-                    # Проверяем ключи, которые могут содержать цвета ('color', 'color_read', 'color_write')
-                    for color_attr in ['color', 'color_read', 'color_write']:
-                         if color_attr in metric_details and isinstance(metric_details[color_attr], list):
-                             # Проверяем, что это похоже на цвет (3 или 4 компоненты)
-                             if len(metric_details[color_attr]) in [3, 4]:
-                                 metric_details[color_attr] = tuple(metric_details[color_attr])
-                             else:
-                                 print(f"[WARN][ConfigLoader] Некорректная длина цвета для '{color_attr}' в метрике '{metric_key}' пайплайна '{pipeline_name_for_error}': {metric_details[color_attr]}. Цвет не будет преобразован.")
+        # 2. Цвета во вложенных словарях (prometheus_colors, prometheus_metric_config и т.п.)
+        _convert_colors_to_tuples(final_pipeline_conf, pipeline_name_for_error)
 
 
         # ... Другие преобразования типов по необходимости ...
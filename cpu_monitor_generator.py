@@ -2,9 +2,11 @@
 
 import time
 import threading
-from collections import deque
+import numpy as np
 import psutil
-from PIL import Image, ImageDraw, ImageFont
+from numba import jit
+from PIL import Image, ImageDraw
+from graphics_engine import cached_truetype
 
 # Попробуем импортировать cpuinfo для имени процессора
 try:
@@ -33,6 +35,56 @@ GRID_ROWS = 4
 GRID_COLS = 5
 GRAPH_POINTS = DEFAULT_HISTORY_LENGTH # Количество точек истории для отрисовки
 
+@jit(nopython=True, cache=True, fastmath=True)
+def _compute_graph_points(hist, cells):
+    """
+    Переводит историю загрузки (ядра, точки) в пиксельные координаты графиков.
+
+    Args:
+        hist (np.ndarray): float32 (число_графиков, число_точек), значения 0..100.
+        cells (np.ndarray): float32 (число_графиков, 4) - x, y, ширина, высота ячейки.
+
+    Returns:
+        np.ndarray: float32 (число_графиков, число_точек, 2) с координатами X и Y.
+    """
+    num_graphs, num_points = hist.shape
+    out = np.empty((num_graphs, num_points, 2), np.float32)
+    x_step = 1.0 / max(1, num_points - 1)
+    for g in range(num_graphs):
+        cx = cells[g, 0]; cy = cells[g, 1]; cw = cells[g, 2]; ch = cells[g, 3]
+        for i in range(num_points):
+            out[g, i, 0] = cx + (i * x_step) * cw
+            out[g, i, 1] = cy + ch - (hist[g, i] / 100.0) * ch
+    return out
+
+def _rasterize_polylines(arr, xs, ys, color):
+    """
+    Рисует ломаные толщиной 1 пиксель прямо в массив кадра (H, W, 3) uint8.
+
+    Args:
+        arr (np.ndarray): Массив кадра, изменяется на месте.
+        xs, ys (np.ndarray): Координаты вершин формы (число_ломаных, число_точек).
+        color (tuple): Цвет линии (R, G, B).
+    """
+    if xs.shape[1] < 2:
+        return
+    # Отрезки берутся только внутри каждой ломаной, без перехода между ними
+    x0 = np.rint(xs[:, :-1]).ravel(); x1 = np.rint(xs[:, 1:]).ravel()
+    y0 = np.rint(ys[:, :-1]).ravel(); y1 = np.rint(ys[:, 1:]).ravel()
+    dx = x1 - x0; dy = y1 - y0
+
+    # Число пикселей на отрезок (как у DDA): по большей из проекций
+    steps = (np.maximum(np.abs(dx), np.abs(dy)) + 1).astype(np.intp)
+    seg = np.repeat(np.arange(steps.size), steps)
+    offs = np.arange(seg.size) - np.repeat(np.cumsum(steps) - steps, steps)
+    t = offs / np.maximum(steps[seg] - 1, 1)
+
+    px = np.rint(x0[seg] + dx[seg] * t).astype(np.intp)
+    py = np.rint(y0[seg] + dy[seg] * t).astype(np.intp)
+    height, width = arr.shape[:2]
+    inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+    arr[py[inside], px[inside]] = color
+
 class CpuMonitorGenerator:
     """
     Класс, генерирующий кадры с изображением монитора ЦП.
@@ -70,18 +122,28 @@ class CpuMonitorGenerator:
         if not self.num_cores:
              raise RuntimeError("Не удалось определить количество ядер ЦП.")
 
-        self._cpu_usage_history = [
-            deque([0.0] * self.history_length, maxlen=self.history_length)
-            for _ in range(self.num_cores)
-        ]
+        # Кольцевой буфер истории: строка на ядро, _write_idx указывает на самую старую точку
+        self._hist = np.zeros((self.num_cores, self.history_length), dtype=np.float32)
+        self._write_idx = 0
+        self._hist_version = 0 # Увеличивается при каждой новой выборке
+
+        # Последний отрисованный кадр (массив) и версия истории, по которой он построен
+        self._cached_frame = None
+        self._cached_version = -1
         self._cpu_name = cpu_name_override if cpu_name_override else self._fetch_cpu_name()
 
         # --- Загрузка шрифтов ---
         self._font_title = self._load_font(font_size=TITLE_FONT_SIZE)
         self._font_sub = self._load_font(font_size=SUBTITLE_FONT_SIZE)
 
+        # --- Статичный слой (фон, заголовок, сетка ячеек) рисуется один раз ---
+        self._template, self._cells = self._build_static_layer()
+        # Те же данные в виде массивов: кадр рисуется в NumPy без ImageDraw
+        self._template_arr = np.asarray(self._template).copy()
+        self._cells_arr = np.array(self._cells, dtype=np.float32).reshape(-1, 4)
+
         # --- Настройка потока ---
-        self._lock = threading.Lock() # Блокировка для доступа к _cpu_usage_history
+        self._lock = threading.Lock() # Блокировка для доступа к _hist и _write_idx
         self._stop_event = threading.Event() # Событие для сигнала остановки потока
         self._data_thread = threading.Thread(target=self._data_collection_loop, daemon=True) # daemon=True для автозавершения
 
@@ -100,7 +162,7 @@ class CpuMonitorGenerator:
     def _load_font(self, font_size):
         """Загружает шрифт, выбрасывает исключение при ошибке."""
         try:
-            return ImageFont.truetype(self._font_path, font_size)
+            return cached_truetype(self._font_path, font_size) # Один разбор TTF на (путь, размер)
         except IOError:
             print(f"Критическая ошибка: Шрифт '{self._font_path}' не найден.")
             raise # Перевыбрасываем исключение
@@ -124,76 +186,78 @@ class CpuMonitorGenerator:
     def _data_collection_loop(self):
         """Целевая функция для фонового потока сбора данных."""
         print("Data collection loop starting.")
+        # Опрос по монотонному дедлайну, чтобы время выполнения итерации не накапливалось в дрейф
+        next_deadline = time.monotonic() + self.update_interval
         while not self._stop_event.is_set():
             try:
+                # interval=None не блокирует: загрузка считается с прошлого вызова, то есть ровно за окно
+                # между дедлайнами, а ожидание идет на _stop_event, и stop() срабатывает сразу
                 current_usage = psutil.cpu_percent(interval=None, percpu=True)
                 if current_usage is not None and len(current_usage) == self.num_cores:
-                    with self._lock: # Захватываем блокировку для обновления
-                        for i in range(self.num_cores):
-                            self._cpu_usage_history[i].append(current_usage[i])
+                    sample = np.asarray(current_usage, dtype=np.float32) # Конвертация вне блокировки
+                    # Некорректные значения чистятся один раз здесь, а не в каждой точке при отрисовке
+                    np.nan_to_num(sample, copy=False, nan=0.0, posinf=100.0, neginf=0.0)
+                    with self._lock: # Захватываем блокировку только на запись столбца
+                        self._hist[:, self._write_idx] = sample
+                        self._write_idx = (self._write_idx + 1) % self.history_length
+                        self._hist_version += 1
                 else:
                     print(f"Предупреждение: Получены некорректные данные от psutil ({current_usage})")
                     # Можно добавить нули в историю при ошибке
                     # with self._lock:
-                    #    for i in range(self.num_cores): self._cpu_usage_history[i].append(0.0)
+                    #    self._hist[:, self._write_idx] = 0.0
+                    #    self._write_idx = (self._write_idx + 1) % self.history_length
 
             except psutil.Error as e:
                  print(f"Ошибка psutil в потоке сбора данных: {e}")
                  # Можно добавить нули или просто пропустить итерацию
                  # with self._lock:
-                 #    for i in range(self.num_cores): self._cpu_usage_history[i].append(0.0)
+                 #    self._hist[:, self._write_idx] = 0.0
+                 #    self._write_idx = (self._write_idx + 1) % self.history_length
             except Exception as e:
                  print(f"Неожиданная ошибка в потоке сбора данных: {e}")
                  # В серьезных случаях можно остановить поток
                  # self.stop()
                  # break
 
-            # Ждем до следующего интервала или сигнала остановки
-            self._stop_event.wait(self.update_interval)
+            # Ждем до следующего дедлайна или сигнала остановки
+            now = time.monotonic()
+            if next_deadline < now - self.update_interval:
+                next_deadline = now # Сильно отстали (например, после паузы системы) - не догоняем пачкой
+            self._stop_event.wait(max(0.0, next_deadline - now))
+            next_deadline += self.update_interval
         print("Data collection loop stopped.")
 
-    def draw_frame(self, target_image):
+    def _build_static_layer(self):
         """
-        Рисует текущее состояние монитора ЦП на предоставленном изображении.
-
-        Args:
-            target_image (PIL.Image.Image): Объект Pillow Image для рисования.
-                                             Размер должен соответствовать разрешению генератора.
+        Рисует неизменяемую часть кадра: фон, заголовок и сетку каждой ячейки.
 
         Returns:
-            PIL.Image.Image: Измененный target_image.
+            tuple: (шаблон PIL.Image.Image, список ячеек графиков
+                    (cell_inner_x, cell_inner_y, cell_inner_width, cell_inner_height)).
         """
-        if target_image.size != self.resolution:
-            print(f"Предупреждение: Размер target_image {target_image.size} не совпадает с разрешением генератора {self.resolution}. Результат может быть искажен.")
-            # Можно добавить обрезку/масштабирование target_image при необходимости
-
-        draw = ImageDraw.Draw(target_image)
+        template = Image.new("RGB", self.resolution, self._colors["background"])
+        draw = ImageDraw.Draw(template)
         width, height = self.resolution
 
-        # --- Получаем копию данных для кадра ---
-        with self._lock: # Блокировка на время копирования
-            current_history_copy = [list(core_deque) for core_deque in self._cpu_usage_history]
-
-        # --- Отрисовка (аналогично предыдущей версии, но использует self для настроек) ---
-        # 1. Фон
-        draw.rectangle([0, 0, width, height], fill=self._colors["background"])
-
-        # 2. Заголовок
+        # 1. Заголовок
         title_y = 15
         draw.text((10, title_y), "ЦП", fill=self._colors["foreground"], font=self._font_title)
         draw.text((70, title_y + 4), self._cpu_name, fill=self._colors["foreground"], font=self._font_sub)
 
-        # 3. Подзаголовок
+        # 2. Подзаголовок
         subtitle_y = title_y + 5
+        # Подзаголовок сейчас отключен. Метод вызывается один раз из __init__,
+        # поэтому при включении textbbox/getbbox ниже не попадут в покадровый путь.
         # subtitle_y = title_y + TITLE_FONT_SIZE + 10
         # subtitle_text_left = f"% использования более {self._graph_points} секунд"
         # subtitle_text_right = "100%"
         # draw.text((10, subtitle_y), subtitle_text_left, fill=self._colors["foreground"], font=self._font_sub)
-        # right_text_bbox = draw.textbbox((0,0), subtitle_text_right, font=self._font_sub)
+        # right_text_bbox = self._font_sub.getbbox(subtitle_text_right)
         # right_text_width = right_text_bbox[2] - right_text_bbox[0]
         # draw.text((width - right_text_width - 10, subtitle_y), subtitle_text_right, fill=self._colors["foreground"], font=self._font_sub)
 
-        # 4. Сетка графиков
+        # 3. Сетка графиков
         grid_area_y_start = subtitle_y + SUBTITLE_FONT_SIZE + 15
         grid_area_height = height - grid_area_y_start - 10
         grid_area_width = width - 20
@@ -202,13 +266,12 @@ class CpuMonitorGenerator:
         padding_x = 5
         padding_y = 5
 
-        num_graphs_available = len(current_history_copy)
-        num_graphs_to_draw = min(num_graphs_available, self._grid_rows * self._grid_cols)
-        graph_index = 0
+        num_graphs_to_draw = min(self.num_cores, self._grid_rows * self._grid_cols)
+        cells = []
 
         for r in range(self._grid_rows):
             for c in range(self._grid_cols):
-                if graph_index >= num_graphs_to_draw: break
+                if len(cells) >= num_graphs_to_draw: break
 
                 cell_x = 10 + c * cell_width
                 cell_y = grid_area_y_start + r * cell_height
@@ -226,24 +289,54 @@ class CpuMonitorGenerator:
                     line_x = cell_inner_x + i * (cell_inner_width / num_v_lines)
                     draw.line([(line_x, cell_inner_y), (line_x, cell_inner_y + cell_inner_height)], fill=self._colors["grid_lines"], width=1)
 
-                # Рисуем график загрузки из скопированных данных
-                core_history = current_history_copy[graph_index]
-                points_to_draw = []
-                num_history_points = len(core_history)
+                cells.append((cell_inner_x, cell_inner_y, cell_inner_width, cell_inner_height))
+            if len(cells) >= num_graphs_to_draw: break
+
+        return template, cells
 
-                if num_history_points > 1:
-                    for i, usage in enumerate(core_history):
-                        try: usage_float = float(usage)
-                        except (ValueError, TypeError): usage_float = 0.0
-                        point_x = cell_inner_x + (i / (num_history_points - 1)) * cell_inner_width
-                        point_y = cell_inner_y + cell_inner_height - (usage_float / 100.0) * cell_inner_height
-                        points_to_draw.append((point_x, point_y))
+    def draw_frame(self, target_image):
+        """
+        Рисует текущее состояние монитора ЦП на предоставленном изображении.
 
-                    if points_to_draw:
-                        draw.line(points_to_draw, fill=self._colors["graph_line"], width=1)
+        Args:
+            target_image (PIL.Image.Image): Объект Pillow Image для рисования.
+                                             Размер должен соответствовать разрешению генератора.
 
-                graph_index += 1
-            if graph_index >= num_graphs_to_draw: break
+        Returns:
+            PIL.Image.Image: Измененный target_image.
+        """
+        # --- Получаем копию данных для кадра ---
+        current_history_copy = None
+        with self._lock: # Блокировка на время копирования
+            version = self._hist_version
+            if version != self._cached_version or self._cached_frame is None:
+                # np.roll возвращает новый массив в хронологическом порядке (от старых точек к новым)
+                current_history_copy = np.roll(self._hist, -self._write_idx, axis=1)
+
+        if current_history_copy is None:
+            # Новых данных с прошлого кадра не было - отдаем уже отрисованный кадр
+            arr = self._cached_frame
+        else:
+            # --- Фон, заголовок и сетка берутся из готового шаблона (копия массива) ---
+            arr = self._template_arr.copy()
+
+            # --- Поверх шаблона рисуются только графики загрузки, все ячейки разом ---
+            num_cells = len(self._cells_arr)
+            if num_cells and self.history_length > 1:
+                points = _compute_graph_points(np.ascontiguousarray(current_history_copy[:num_cells]), self._cells_arr)
+                _rasterize_polylines(arr, points[:, :, 0], points[:, :, 1], self._colors["graph_line"])
+
+            self._cached_frame = arr
+            self._cached_version = version
+
+        # Единственная проверка размера за кадр: она же выбирает быстрый путь загрузки пикселей
+        if target_image.mode == "RGB" and target_image.size == self.resolution:
+            target_image.frombytes(arr.tobytes()) # Загрузка пикселей в существующее изображение
+        else:
+            if __debug__ and target_image.size != self.resolution:
+                print(f"Предупреждение: Размер target_image {target_image.size} не совпадает с разрешением генератора {self.resolution}. Результат может быть искажен.")
+                # Можно добавить обрезку/масштабирование target_image при необходимости
+            target_image.paste(Image.fromarray(arr, "RGB"))
 
         return target_image
 
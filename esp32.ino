@@ -161,7 +161,7 @@ void loop() {
     // --- Если мы здесь, клиент ПОДКЛЮЧЕН ---
 
     // 2. Проверяем наличие данных от сервера
-    // Заголовок: X(2B)+Y(2B)+W(2B)+H(2B)+DataLen(4B) = 12 байт
+    // Заголовок: X(2B)+Y(2B)+W(2B)+H(2B)+DataLen(4B) = 12 байт (старший бит DataLen — разреженная дельта)
     const size_t HEADER_SIZE = 12;
     if (client.available() >= HEADER_SIZE) {
         uint8_t header[HEADER_SIZE];
@@ -182,6 +182,9 @@ void loop() {
                            ((uint32_t)header[9]  << 16) |
                            ((uint32_t)header[10] << 8)  |
                            header[11];
+        // Старший бит длины — признак разреженной дельты: пары (индекс пикселя uint16, цвет RGB565), по 4 байта
+        bool sparseDelta = (dataLen & 0x80000000UL) != 0;
+        dataLen &= 0x7FFFFFFFUL;
 
         // Debug: можно раскомментировать для отладки заголовков
         // Serial.printf("Received Header: Rect(%u, %u, %u x %u), DataLen: %u bytes\n", x, y, w, h, dataLen);
@@ -224,6 +227,24 @@ void loop() {
         } else if (dataLen == 0 && (w > 0 && h > 0)) {
              Serial.printf("Warning: Received non-zero dimension (w=%u, h=%u) but dataLen=0.\n", w, h);
              // Ничего не делаем, пропускаем
+        } else if (sparseDelta && dataLen > 0 && w > 0 && h > 0) {
+             // Разреженная дельта: рисуем только изменившиеся пиксели прямоугольника
+             if (readExact(client, pixelBuffer, dataLen)) {
+                 uint32_t pixelCount = (uint32_t)w * h;
+                 tft.startWrite();
+                 for (uint32_t i = 0; i + 4 <= dataLen; i += 4) {
+                     uint16_t idx = ((uint16_t)pixelBuffer[i] << 8) | pixelBuffer[i + 1];
+                     uint16_t color = ((uint16_t)pixelBuffer[i + 2] << 8) | pixelBuffer[i + 3];
+                     if (idx < pixelCount) {
+                         tft.drawPixel(x + idx % w, y + idx / w, color);
+                     }
+                 }
+                 tft.endWrite();
+             } else {
+                 Serial.println("Failed to read sparse delta or client disconnected during read.");
+                 client.stop(); // Закрываем соединение
+                 return; // Переход к переподключению
+             }
         } else if (dataLen > 0 && w > 0 && h > 0) {
             // Ожидаемый размер для RGB565
              uint32_t expectedDataLen = (uint32_t)w * h * 2;
@@ -2,34 +2,268 @@
 
 import math
 from collections import deque
+from functools import lru_cache, partial
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+try:
+    from numba import njit
+except ImportError: # numba is optional here; sparklines fall back to plain NumPy
+    njit = None
+
 # --- Helper Functions (Moved Here) ---
-def format_bytes(byte_value, precision=1):
-    """Converts bytes to a human-readable format (KB, MB, GB, TB)."""
-    if byte_value is None or not isinstance(byte_value, (int, float)) or byte_value < 0 or math.isnan(byte_value):
-        return "N/A"
+# Keys are the exact (value, precision): typed=True keeps 1 and 1.0 apart, so a cache hit always returns
+# exactly what the formatter would compute for that input
+@lru_cache(maxsize=4096, typed=True)
+def _format_bytes_cached(byte_value, precision):
     if byte_value == 0:
         return f"{0.0:.{precision}f} B"
-    log_val = math.log(max(byte_value, 1), 1024)
     units = ['B', 'KB', 'MB', 'GB', 'TB']
-    unit_index = min(int(log_val), len(units) - 1)
-    scaled_value = byte_value / (1024 ** unit_index)
+    # Unit index = floor(log1024(value)): exact via bit_length for ints, log2 for floats; values < 1 stay in bytes
+    if isinstance(byte_value, int):
+        unit_index = (byte_value.bit_length() - 1) // 10
+    else:
+        unit_index = int(math.log2(byte_value)) // 10 if byte_value >= 1 else 0
+    unit_index = min(unit_index, len(units) - 1)
+    scaled_value = byte_value / (1 << (10 * unit_index))
     return f"{scaled_value:.{precision}f} {units[unit_index]}"
 
-def format_bytes_per_second(bps_value, precision=1):
-    """Formats bytes per second into a human-readable format (KB/s, MB/s, etc.)."""
-    if bps_value is None or not isinstance(bps_value, (int, float)) or math.isnan(bps_value):
-         return "N/A"
-    if bps_value == 0:
-         base_str = format_bytes(bps_value, precision)
-         return f"{base_str}/s"
+def format_bytes(byte_value, precision=1):
+    """Converts bytes to a human-readable format (KB, MB, GB, TB). Results are memoized per exact value."""
+    if byte_value is None or not isinstance(byte_value, (int, float)) or byte_value < 0 or math.isnan(byte_value):
+        return "N/A"
+    return _format_bytes_cached(byte_value, precision)
+
+@lru_cache(maxsize=4096, typed=True)
+def _format_bytes_per_second_cached(bps_value, precision):
     formatted_bytes = format_bytes(bps_value, precision)
     if formatted_bytes == "N/A": return "N/A"
+    if bps_value == 0:
+         return f"{formatted_bytes}/s"
     parts = formatted_bytes.split(' ')
     if len(parts) == 2: return f"{parts[0]}{parts[1]}/s"
     else: return f"{formatted_bytes}/s"
 
+def format_bytes_per_second(bps_value, precision=1):
+    """Formats bytes per second into a human-readable format (KB/s, MB/s, etc.). Results are memoized per exact value."""
+    if bps_value is None or not isinstance(bps_value, (int, float)) or math.isnan(bps_value):
+         return "N/A"
+    return _format_bytes_per_second_cached(bps_value, precision)
+
+@lru_cache(maxsize=64)
+def cached_truetype(font_path, font_size, layout_engine=None):
+    """
+    Loads a TrueType font once per (path, size, layout_engine) and shares it between callers.
+    Raises the same exceptions as ImageFont.truetype; failures are not cached.
+    """
+    return ImageFont.truetype(font_path, font_size, layout_engine=layout_engine)
+
+@lru_cache(maxsize=1)
+def cached_default_font():
+    """Loads the built-in PIL font once; used as the fallback when a TTF file is missing."""
+    return ImageFont.load_default()
+
+# Cache of pre-rasterized glyph masks: (font, char) -> (mask_image, bbox, advance)
+_GLYPH_CACHE = {}
+
+def _get_glyph(font, ch):
+    """Returns the cached (mask, bbox, advance) for a single character, rasterizing it on first use."""
+    key = (font, ch)
+    glyph = _GLYPH_CACHE.get(key)
+    if glyph is None:
+        bbox = font.getbbox(ch)
+        w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        mask = None
+        if w > 0 and h > 0:
+            mask = Image.new("L", (w, h), 0)
+            ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), ch, fill=255, font=font)
+        glyph = (mask, bbox, font.getlength(ch))
+        _GLYPH_CACHE[key] = glyph
+    return glyph
+
+def blit_text(target_image, xy, text, font, fill):
+    """
+    Draws single-line text by pasting cached per-glyph masks instead of calling draw.text().
+    Intended for short strings redrawn every frame (clock digits, titles); kerning is not applied.
+    """
+    x, y = xy
+    for ch in text:
+        mask, bbox, advance = _get_glyph(font, ch)
+        if mask is not None:
+            gx, gy = int(round(x)) + bbox[0], y + bbox[1]
+            target_image.paste(fill, (gx, gy, gx + mask.width, gy + mask.height), mask)
+        x += advance
+    return x
+
+if njit is not None:
+    @njit(cache=True, fastmath={'contract', 'arcp', 'reassoc'}) # no 'nnan': NaN checks must survive
+    def _sparkline_points(history_arr, x, y, w, h, min_v, max_v):
+        """Maps history values to int32 pixel coordinates (NaN -> min_v, others clamped to [min_v, max_v])."""
+        n = history_arr.shape[0]
+        xs = np.empty(n, dtype=np.int32)
+        ys = np.empty(n, dtype=np.int32)
+        span = max_v - min_v
+        if span <= 0.0:
+            span = 1.0
+        x_step = w / max(1, n - 1)
+        for i in range(n):
+            v = history_arr[i]
+            if np.isnan(v):
+                v = min_v
+            elif v < min_v:
+                v = min_v
+            elif v > max_v:
+                v = max_v
+            xs[i] = np.int32(np.rint(x + i * x_step))
+            ys[i] = np.int32(np.rint(y + h - ((v - min_v) / span) * h)) # Y=0 is top
+        return xs, ys
+
+    @njit(cache=True)
+    def _rasterize_polyline(arr, points, r, g, b, width):
+        """
+        Draws a polyline straight into an (H, W, 3) uint8 array with Bresenham.
+        width == 2 also sets the neighbour pixel across the major axis (below for shallow, right for steep segments).
+        """
+        h, w = arr.shape[0], arr.shape[1]
+        for s in range(points.shape[0] - 1):
+            x0, y0 = points[s, 0], points[s, 1]
+            x1, y1 = points[s + 1, 0], points[s + 1, 1]
+            dx = abs(x1 - x0)
+            dy = -abs(y1 - y0)
+            sx = 1 if x0 < x1 else -1
+            sy = 1 if y0 < y1 else -1
+            steep = -dy > dx
+            err = dx + dy
+            while True:
+                for k in range(width):
+                    px = x0 + k if steep else x0
+                    py = y0 if steep else y0 + k
+                    if 0 <= px < w and 0 <= py < h:
+                        arr[py, px, 0] = r
+                        arr[py, px, 1] = g
+                        arr[py, px, 2] = b
+                if x0 == x1 and y0 == y1:
+                    break
+                e2 = 2 * err
+                if e2 >= dy:
+                    err += dy
+                    x0 += sx
+                if e2 <= dx:
+                    err += dx
+                    y0 += sy
+else:
+    _sparkline_points = None
+    _rasterize_polyline = None
+
+class HistoryBuffer:
+    """
+    Fixed-size ring buffer of samples backed by a NumPy array: a drop-in for deque(maxlen=N)
+    in metric histories that lets sparklines read contiguous memory without building a list.
+    Integer dtypes store fixed-point values (value * scale); see history_storage_for().
+    """
+    __slots__ = ("maxlen", "buf", "idx", "count", "scale", "_int_limits", "version")
+
+    def __init__(self, maxlen, dtype=np.float32, fill=None, scale=1.0):
+        self.maxlen = max(1, int(maxlen))
+        self.buf = np.zeros(self.maxlen, dtype=dtype)
+        self.idx = 0 # Next write position
+        self.count = 0
+        self.scale = scale
+        self._int_limits = None
+        self.version = 0 # Bumped on every append/clear; copies keep it, so equal versions mean equal contents
+        if np.issubdtype(self.buf.dtype, np.integer):
+            info = np.iinfo(self.buf.dtype)
+            self._int_limits = (int(info.min), int(info.max))
+        if fill is not None: # Pre-filled like deque([fill] * maxlen, maxlen=maxlen)
+            self.buf.fill(self._encode(fill))
+            self.count = self.maxlen
+
+    def _encode(self, value):
+        value = value * self.scale
+        if self._int_limits is not None:
+            lo, hi = self._int_limits
+            if math.isfinite(value):
+                value = min(hi, max(lo, round(value)))
+            elif value != value: # NaN -> 0
+                value = 0
+            else: # round(inf) raises OverflowError: +inf/-inf saturate to the dtype limits
+                value = hi if value > 0 else lo
+        return value
+
+    def append(self, value):
+        self.buf[self.idx] = self._encode(value)
+        self.idx = (self.idx + 1) % self.maxlen
+        if self.count < self.maxlen:
+            self.count += 1
+        self.version += 1
+
+    def clear(self):
+        self.idx = 0
+        self.count = 0
+        self.version += 1
+
+    def copy(self):
+        clone = HistoryBuffer.__new__(HistoryBuffer)
+        clone.maxlen, clone.buf, clone.idx, clone.count = self.maxlen, self.buf.copy(), self.idx, self.count
+        clone.scale, clone._int_limits, clone.version = self.scale, self._int_limits, self.version
+        return clone
+
+    def view(self):
+        """Returns the raw stored samples oldest -> newest (zero-copy unless the ring has wrapped mid-buffer)."""
+        if self.count < self.maxlen:
+            return self.buf[self.idx - self.count:self.idx]
+        if self.idx == 0:
+            return self.buf
+        return np.concatenate((self.buf[self.idx:], self.buf[:self.idx]))
+
+    def values(self):
+        """Returns the samples oldest -> newest as a new float64 array in real units (scale removed)."""
+        values = self.view().astype(np.float64)
+        if self.scale != 1.0:
+            values /= self.scale
+        return values
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.values().tolist())
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("HistoryBuffer index out of range")
+        raw = self.buf[(self.idx - self.count + index) % self.maxlen].item()
+        return raw / self.scale if self.scale != 1.0 else raw
+
+def history_storage_for(config):
+    """
+    Picks the (dtype, scale) used to store a metric's history:
+    percentage metrics (unit "%" with range [0, 100]) -> int16 fixed-point with 0.01 resolution;
+    everything else (e.g. disk bytes/s, which can reach GB/s) -> float32.
+    """
+    data_range = config.get("range")
+    if config.get("unit") == "%" and isinstance(data_range, (list, tuple)) and tuple(data_range) == (0, 100):
+        return np.int16, 100.0
+    return np.float32, 1.0
+
+# Cache of text bounding boxes at origin: (text, font, anchor, align, spacing) -> bbox
+_BBOX_CACHE = {}
+_BBOX_CACHE_MAX = 4096 # Value strings vary; the cache is simply dropped when it grows past this
+
+def _tbbox(draw, xy, text, font, anchor=None, align="left", spacing=4):
+    """Memoized draw.textbbox(): the bbox is measured once at (0, 0) and offset to xy."""
+    key = (text, font, anchor, align, spacing)
+    bbox = _BBOX_CACHE.get(key)
+    if bbox is None:
+        bbox = draw.textbbox((0, 0), text, font=font, anchor=anchor, align=align, spacing=spacing)
+        if len(_BBOX_CACHE) >= _BBOX_CACHE_MAX:
+            _BBOX_CACHE.clear()
+        _BBOX_CACHE[key] = bbox
+    x, y = xy
+    return (bbox[0] + x, bbox[1] + y, bbox[2] + x, bbox[3] + y)
+
 class MonitorGraphicsEngine:
     """
     Handles the drawing of monitor frames using Pillow.
@@ -41,9 +275,20 @@ class MonitorGraphicsEngine:
         self.resolution = resolution
         self._font_path = font_path
         self._colors = colors
+        # Colors bound once to attributes (no dict lookups on the draw path)
+        self._c_bg = colors["background"]
+        self._c_fg = colors["foreground"]
+        self._c_border = colors["cell_border"]
+        self._c_grid = colors["grid_lines"]
+        self._c_value = colors["value_color"]
+        self._c_error = colors["error"]
+        self._c_graph = colors["graph_line"]
         self._grid_layout = grid_layout
         self._metric_config = metric_config
-        self._history_length = history_length # Needed for default deque on error
+        self._history_length = history_length # Needed for default history on error
+        # Shared read-only defaults for missing histories (never appended to)
+        self._default_history = HistoryBuffer(history_length, fill=0.0)
+        self._default_total_history = HistoryBuffer(1, fill=0.0)
 
         if not self._grid_layout:
              raise ValueError("Grid layout cannot be empty.")
@@ -55,48 +300,111 @@ class MonitorGraphicsEngine:
         self._font_title = self._load_font(title_font_size)
         self._font_value = self._load_font(value_font_size)
         self._font_unit = self._load_font(unit_font_size)
+
+        # Titles are static: pre-render each one into an "L" mask once, pasted with the foreground color
+        self._title_font_size = self._font_title.size
+        self._title_masks = {} # metric_key -> (mask or None, bbox at origin)
+        for metric_key, config in self._metric_config.items():
+            if "title" in config:
+                self._title_masks[metric_key] = self._render_text_mask(config["title"], self._font_title)
+
+        # Per-cell render cache: (r, c) -> state_key of what the cell canvas currently shows.
+        # A cell is re-rendered only when the data it displays changes.
+        self._cell_cache = {}
+        # Persistent per-cell canvases with a bound draw context: (r, c) -> (Image, ImageDraw)
+        self._cell_canvases = {}
+        # Static grid geometry for self.resolution (rebuilt in draw_frame if the target size differs)
+        self._cell_rects, self._filler_boxes = self._build_cell_rects(self.resolution)
+        self._cell_rects_size = tuple(self.resolution)
+        # Frame-level memo: skip draw_frame entirely if the same target already shows the same data
+        self._last_target = None
+        self._last_data_signature = None
+        # Cell background + border images: (cell_w, cell_h) -> Image
+        self._cell_frame_cache = {}
+        # Sparkline grid masks: (width, height, h_lines, v_lines, line_width) -> "L" Image
+        self._grid_template_cache = {}
         print("MonitorGraphicsEngine initialized.")
 
+    @staticmethod
+    def _render_text_mask(text, font):
+        """Renders text once into an "L" mask; returns (mask or None if empty, bbox relative to the draw origin)."""
+        bbox = font.getbbox(text)
+        w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        if w <= 0 or h <= 0:
+            return None, bbox
+        mask = Image.new("L", (w, h), 0)
+        ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), text, fill=255, font=font)
+        return mask, bbox
+
     def _load_font(self, font_size):
-        """Loads the specified font or falls back to default."""
+        """Loads the specified font (shared via cached_truetype) or falls back to default."""
         try:
             # Try using RAQM layout for better complex script handling if available
-            return ImageFont.truetype(self._font_path, font_size, layout_engine=ImageFont.Layout.RAQM)
+            return cached_truetype(self._font_path, font_size, ImageFont.Layout.RAQM)
         except ImportError:
              # Fallback if RAQM not needed or PIL version is older
-             return ImageFont.truetype(self._font_path, font_size)
+             return cached_truetype(self._font_path, font_size)
         except IOError:
             print(f"CRITICAL ERROR: Font file '{self._font_path}' not found.")
             try:
                 print("Attempting to load default PIL font as fallback.")
                 # Load default font with specific size (requires recent Pillow versions)
                 # return ImageFont.load_default(font_size) # Use this if your Pillow supports it
-                return ImageFont.load_default() # Older fallback
+                return cached_default_font() # Older fallback, loaded once
             except Exception as e:
                 raise RuntimeError(f"Font '{self._font_path}' not found and default font failed: {e}")
 
-    def draw_sparkline_with_grid(self, draw, history_deque, x, y, width, height, color, data_range=None, current_value_for_range=None, metric_key_debug=None, disk_range_max_value=None):
-        """Draws the sparkline graph with grid lines."""
+    def _get_grid_mask(self, width, height, num_h_lines, num_v_lines, line_width):
+        """Returns the cached "L" mask with the sparkline grid lines for a graph of the given size."""
+        key = (width, height, num_h_lines, num_v_lines, line_width)
+        grid_mask = self._grid_template_cache.get(key)
+        if grid_mask is None:
+            # +1: lines are drawn up to x + width / y + height inclusive
+            grid_mask = Image.new("L", (width + 1, height + 1), 0)
+            mask_draw = ImageDraw.Draw(grid_mask)
+            if num_h_lines > 0:
+                step_y = height / (num_h_lines + 1)
+                for i in range(1, num_h_lines + 1):
+                    line_y = round(i * step_y)
+                    mask_draw.line([(0, line_y), (width, line_y)], fill=255, width=line_width)
+            if num_v_lines > 0:
+                step_x = width / (num_v_lines + 1)
+                for i in range(1, num_v_lines + 1):
+                    line_x = round(i * step_x)
+                    mask_draw.line([(line_x, 0), (line_x, height)], fill=255, width=line_width)
+            self._grid_template_cache[key] = grid_mask
+        return grid_mask
+
+    def draw_sparkline_with_grid(self, draw, history_deque, x, y, width, height, color, data_range=None, current_value_for_range=None, metric_key_debug=None, disk_range_max_value=None, target_image=None, pending_lines=None):
+        """
+        Draws the sparkline graph with grid lines.
+        If target_image (the image behind `draw`) is given, the grid is pasted from a cached mask.
+        If pending_lines is a list, the line is not drawn: (points int32 (N, 2), color) is appended to it instead.
+        """
         # --- This method remains largely the same as before ---
         # --- Key change: Receives disk_range_max_value if needed ---
-        history = list(history_deque)
+        history = history_deque
         num_points = len(history)
-        grid_color = self._colors["grid_lines"]
+        grid_color = self._c_grid
         num_h_lines = 3
         num_v_lines = 4
         grid_line_width = 1
 
-        # Draw Grid
-        if height > 0 and num_h_lines > 0:
-            step_y = height / (num_h_lines + 1)
-            for i in range(1, num_h_lines + 1):
-                line_y = round(y + i * step_y)
-                draw.line([(x, line_y), (x + width, line_y)], fill=grid_color, width=grid_line_width)
-        if width > 0 and num_v_lines > 0:
-            step_x = width / (num_v_lines + 1)
-            for i in range(1, num_v_lines + 1):
-                line_x = round(x + i * step_x)
-                draw.line([(line_x, y), (line_x, y + height)], fill=grid_color, width=grid_line_width)
+        # Draw Grid: constant geometry, so it is rendered once per size into a mask and pasted
+        if target_image is not None and width > 0 and height > 0:
+            grid_mask = self._get_grid_mask(width, height, num_h_lines, num_v_lines, grid_line_width)
+            target_image.paste(grid_color, (x, y, x + grid_mask.width, y + grid_mask.height), grid_mask)
+        else:
+            if height > 0 and num_h_lines > 0:
+                step_y = height / (num_h_lines + 1)
+                for i in range(1, num_h_lines + 1):
+                    line_y = round(y + i * step_y)
+                    draw.line([(x, line_y), (x + width, line_y)], fill=grid_color, width=grid_line_width)
+            if width > 0 and num_v_lines > 0:
+                step_x = width / (num_v_lines + 1)
+                for i in range(1, num_v_lines + 1):
+                    line_x = round(x + i * step_x)
+                    draw.line([(line_x, y), (line_x, y + height)], fill=grid_color, width=grid_line_width)
 
         if num_points < 2: return # Need at least two points to draw a line
 
@@ -131,58 +439,280 @@ class MonitorGraphicsEngine:
         # Debug print for range
         # if metric_key_debug: print(f"DEBUG [{metric_key_debug}]: Range={min_val:.2f}-{max_val:.2f}, Span={value_span:.2f}, Source='{range_source}', Points={num_points}")
 
-        # Prepare points
-        points_to_draw = []
-        for i, value in enumerate(history):
-            draw_value = min_val # Default to min if value is invalid
-            if value is not None and isinstance(value, (int, float)) and not math.isnan(value):
-                # Clamp value within the determined range for drawing
-                draw_value = max(min_val, min(value, max_val))
-                # draw_value = value # Alternative: Don't clamp, let it go off-graph
-
-            point_x = x + (i / max(1, num_points - 1)) * width
-            normalized_y = (draw_value - min_val) / value_span
-            point_y = y + height - (normalized_y * height) # Y=0 is top
-
-            points_to_draw.append((round(point_x), round(point_y)))
-
-            # Debug print for points
-            # if metric_key_debug and i % (num_points // 5 + 1) == 0: print(f"   Point {i}: raw={value}, draw={draw_value:.2f}, normY={normalized_y:.2f}, X={point_x:.1f}, Y={point_y:.1f}")
+        # Prepare points as a flat [x0, y0, x1, y1, ...] sequence (cheaper for Pillow than a list of tuples)
+        try:
+            if isinstance(history, HistoryBuffer):
+                values = history.values() # Contiguous samples, no per-element Python objects
+            else:
+                values = np.fromiter(history, dtype=np.float64, count=num_points)
+        except (TypeError, ValueError):
+            # History contains None or non-numeric entries: treat them as NaN
+            values = np.array([v if isinstance(v, (int, float)) else np.nan for v in history], dtype=np.float64)
+        if _sparkline_points is not None:
+            xs, ys = _sparkline_points(values, float(x), float(y), float(width), float(height), float(min_val), float(max_val))
+            points = np.empty((num_points, 2), dtype=np.int32)
+            points[:, 0] = xs
+            points[:, 1] = ys
+        else:
+            # Invalid values are drawn at min; valid ones are clamped within the determined range.
+            # values is always a fresh float64 array here, so both steps run in place.
+            draw_values = np.nan_to_num(values, copy=False, nan=min_val, posinf=max_val, neginf=min_val)
+            np.clip(draw_values, min_val, max_val, out=draw_values)
+            points = np.empty((num_points, 2), dtype=np.float64)
+            points[:, 0] = x + (np.arange(num_points) / max(1, num_points - 1)) * width
+            points[:, 1] = y + height - ((draw_values - min_val) / value_span) * height # Y=0 is top
+            points = np.round(points).astype(np.int32)
+        if pending_lines is not None:
+            pending_lines.append((points, color))
+            return
+        points_to_draw = points.ravel().tolist()
 
         # Draw line
-        if len(points_to_draw) > 1:
+        if len(points_to_draw) > 2:
             # Debug print before drawing
-            # print(f"DEBUG [{metric_key_debug}]: Drawing line with {len(points_to_draw)} points. First: {points_to_draw[0]}, Last: {points_to_draw[-1]}")
+            # print(f"DEBUG [{metric_key_debug}]: Drawing line with {len(points_to_draw) // 2} points. First: {points_to_draw[:2]}, Last: {points_to_draw[-2:]}")
             draw.line(points_to_draw, fill=color, width=2)
-        # else: print(f"DEBUG [{metric_key_debug}]: Not drawing line, points count = {len(points_to_draw)}")
-
-
-    def draw_frame(self, target_image, current_metric_data):
-        """Draws a complete frame onto the target_image using the provided data."""
-        if target_image.size != self.resolution:
-             print(f"Warning: Target image size {target_image.size} differs from configured resolution {self.resolution}.")
-             # Consider resizing target_image or adjusting drawing logic if needed
-             # For now, proceed with the target image size, drawing might be clipped/misaligned
-
-        draw = ImageDraw.Draw(target_image)
-        # Use target_image size for calculations to be safe
-        width, height = target_image.size
-
-        # Clear background
-        draw.rectangle([0, 0, width, height], fill=self._colors["background"])
+        # else: print(f"DEBUG [{metric_key_debug}]: Not drawing line, points count = {len(points_to_draw) // 2}")
+
+
+    def _cell_values_disk(self, config, unit, current_metric_data, graph_colors):
+        """Disk: Read/Write. Returns (value_text, unit_text, unit_color, graph_colors, graph_histories, current_total_for_range)."""
+        read_data = current_metric_data.get('disk_read', {})
+        write_data = current_metric_data.get('disk_write', {})
+        current_read = read_data.get('current')
+        current_write = write_data.get('current')
+
+        # Format values (use helper functions)
+        val_read_str = format_bytes_per_second(current_read, 0).replace('/s','')
+        val_write_str = format_bytes_per_second(current_write, 0).replace('/s','')
+        value_text = f"{val_read_str} R\n{val_write_str} W"
+        unit_text = "B/s" # Base unit text
+
+        # Graph data
+        graph_histories = [read_data.get('history', self._default_history),
+                           write_data.get('history', self._default_history)]
+        return value_text, unit_text, self._c_value, graph_colors, graph_histories, None
+
+    def _cell_values_ram(self, config, unit, current_metric_data, graph_colors):
+        """RAM: Used/Total. Returns the same tuple as _cell_values_disk."""
+        used_data = current_metric_data.get('ram_used', {})
+        total_data = current_metric_data.get('ram_total', {}) # Total is stored differently
+        current_used = used_data.get('current')
+        # Total RAM is usually static, get the single value from its 'history' deque
+        # Provide a default list [0.0] if key/history is missing
+        total_history = total_data.get('history', self._default_total_history)
+        current_total_val = total_history[0] if total_history else 0.0
+
+        if current_used is not None and current_total_val is not None and \
+           not math.isnan(current_used) and not math.isnan(current_total_val) and current_total_val > 0:
+            # Format value (use helper function)
+            used_gb_str = format_bytes(current_used, 1).replace(' GB', '')
+            # total_gb_str = format_bytes(current_total_val, 1) # Could display total too
+            graph_histories = [used_data.get('history', self._default_history)]
+            # Pass total for dynamic range
+            return f"{used_gb_str}", "GB", self._c_value, graph_colors, graph_histories, current_total_val
+        # Provide default history on error to prevent crash in sparkline
+        return "N/A", "", self._c_error, graph_colors, [self._default_history], None
+
+    def _cell_values_single(self, config, unit, current_metric_data, graph_colors, metric_key):
+        """Single value metrics (GPU Load, GPU RAM %, GPU Temp, CPU Load). Returns the same tuple as _cell_values_disk."""
+        metric_data = current_metric_data.get(metric_key, {})
+        current_val = metric_data.get('current')
+
+        if current_val is not None and not (isinstance(current_val, float) and math.isnan(current_val)):
+            # Format based on unit
+            if unit == "%": value_text = f"{current_val:.0f}"
+            elif unit == "°C": value_text = f"{current_val:.0f}"
+            else: value_text = f"{current_val:.1f}" # Default formatting
+            unit_text = unit
+            unit_color = self._c_value
+        else:
+            value_text = "N/A"
+            unit_text = ""
+            unit_color = self._c_error
+
+        # Provide default history on error
+        graph_histories = [metric_data.get('history', self._default_history)]
+        return value_text, unit_text, unit_color, graph_colors, graph_histories, None
+
+    def _resolve_cell_handler(self, metric_key, config):
+        """Picks, once per cell, the values handler (with its graph colors bound) and the data sub-keys a metric reads."""
+        if metric_key == "disk_usage":
+            graph_colors = [config.get("color_read", self._c_graph), config.get("color_write", self._c_graph)]
+            return partial(self._cell_values_disk, graph_colors=graph_colors), ('disk_read', 'disk_write')
+        graph_colors = [config.get("color", self._c_graph)]
+        if metric_key == "ram_usage":
+            return partial(self._cell_values_ram, graph_colors=graph_colors), ('ram_used', 'ram_total')
+        return partial(self._cell_values_single, graph_colors=graph_colors, metric_key=metric_key), (metric_key,)
+
+    @staticmethod
+    def _cell_state_key(metric_key, sub_keys, current_metric_data, disk_dynamic_max):
+        """Builds a hashable snapshot of everything a cell displays, used to detect unchanged cells."""
+        parts = []
+        for sub_key in sub_keys:
+            data = current_metric_data.get(sub_key, {})
+            current = data.get('current')
+            if isinstance(current, float):
+                current = None if math.isnan(current) else round(current, 2) # NaN never compares equal
+            history = data.get('history')
+            if isinstance(history, HistoryBuffer):
+                history = history.view().tobytes()
+            elif history is not None:
+                history = tuple(history)
+            parts.append((current, history))
+        return (metric_key, tuple(parts), disk_dynamic_max if metric_key == "disk_usage" else None)
+
+    def _get_cell_canvas(self, r, c, cell_w, cell_h):
+        """Returns the persistent (Image, ImageDraw) pair for a cell, recreating it only if the cell size changed."""
+        canvas = self._cell_canvases.get((r, c))
+        if canvas is None or canvas[0].size != (cell_w, cell_h):
+            cell_image = Image.new("RGB", (cell_w, cell_h), self._c_bg)
+            canvas = (cell_image, ImageDraw.Draw(cell_image))
+            self._cell_canvases[(r, c)] = canvas
+        return canvas
+
+    def _get_cell_frame(self, cell_w, cell_h):
+        """Returns the cached background + border image for a cell size (the part of a cell that never changes)."""
+        frame = self._cell_frame_cache.get((cell_w, cell_h))
+        if frame is None:
+            frame = Image.new("RGB", (cell_w, cell_h), self._c_bg)
+            ImageDraw.Draw(frame).rectangle([0, 0, cell_w, cell_h], outline=self._c_border, width=2)
+            self._cell_frame_cache[(cell_w, cell_h)] = frame
+        return frame
+
+    def _render_cell(self, metric_key, config, cell_values, cell_image, draw, current_metric_data, disk_dynamic_max):
+        """Renders one grid cell (background, border, text and sparklines) into its persistent canvas."""
+        cell_w, cell_h = cell_image.size
+        padding = 5
 
-        # --- Drawing logic remains very similar to the original draw_frame ---
-        # --- Key difference: Uses 'current_metric_data' passed as argument ---
-        # --- instead of 'self.metric_data'                         ---
+        # Clear and draw the cell border in one paste from the cached per-size frame
+        cell_image.paste(self._get_cell_frame(cell_w, cell_h))
+
+        # Content area within cell
+        content_x = padding
+        content_y = padding
+        content_width = max(0, cell_w - 2 * padding)
+        content_height = max(0, cell_h - 2 * padding)
+
+        if content_width <= 0 or content_height <= 0:
+            return cell_image # Skip drawing content if cell is too small
+
+        # --- Text and Graph Rendering (mostly same as before) ---
+        title = config["title"]
+        unit = config.get("unit", "")
+        data_range_from_config = config.get("range")
+
+        # Title (pasted from the mask pre-rendered in __init__)
+        title_x = content_x + 5
+        title_y = content_y + 5
+        title_mask, title_bbox = self._title_masks.get(metric_key) or self._render_text_mask(title, self._font_title)
+        if title_mask is not None:
+            tx, ty = title_x + title_bbox[0], title_y + title_bbox[1]
+            cell_image.paste(self._c_fg, (tx, ty, tx + title_mask.width, ty + title_mask.height), title_mask)
+
+        # Value Area Start
+        value_area_y_start = title_y + self._title_font_size + 10 # Use font size directly
+
+        # Metric-specific values (handler resolved once per cell in _build_cell_rects)
+        value_text, unit_text, unit_color, graph_colors, graph_histories, current_total_for_range = \
+            cell_values(config, unit, current_metric_data)
+
+        # Draw Value Text
+        # Use textbbox for potentially better sizing with multi-line text (like Disk R/W)
+        value_bbox = _tbbox(draw, (content_x + 10, value_area_y_start), value_text, self._font_value, anchor="la", align="left", spacing=0)
+        value_width = value_bbox[2] - value_bbox[0]
+        value_height = value_bbox[3] - value_bbox[1]
+        value_x = content_x + 10
+        value_y = value_area_y_start
+
+        draw.text((value_x, value_y), value_text, fill=unit_color, font=self._font_value, anchor="la", align="left") # Use 'la' anchor (left, baseline of first line)
+
+        # Draw Unit Text (if present)
+        if unit_text:
+            # Position unit relative to the bounding box of the value text
+            unit_bbox = _tbbox(draw, (0, 0), unit_text, self._font_unit, anchor="ls") # Left, top
+            unit_width = unit_bbox[2] - unit_bbox[0]
+            # unit_height = unit_bbox[3] - unit_bbox[1] # Not usually needed for positioning
+
+            unit_x = value_x + value_width + 5  # Position after value text
+            unit_y = value_y + value_height      # Align baseline with bottom of value text bbox
+
+            # Prevent unit from going off the right edge
+            if unit_x + unit_width > content_x + content_width - 5:
+                unit_x = content_x + content_width - unit_width - 5 # Adjust to fit
+
+            # Draw unit text using 'ls' anchor (left, baseline)
+            draw.text((unit_x, unit_y), unit_text, fill=unit_color, font=self._font_unit, anchor="ls")
+
+
+        # Graph Area Calculation
+        graph_area_y_start = value_y + value_height + 15 # Space below value text
+        graph_height = max(10, (content_y + content_height) - graph_area_y_start - 5) # Remaining height
+        graph_y = graph_area_y_start
+        graph_width = content_width # Use full content width
+
+        # Draw Sparkline(s)
+        # Ensure histories are valid deques / HistoryBuffers before iterating
+        valid_histories = [h for h in graph_histories if isinstance(h, (deque, HistoryBuffer))]
+
+        if not graph_colors:
+             print(f"ERROR: graph_colors list is empty for metric {metric_key}")
+             return cell_image # Skip drawing graph if no colors defined
+
+        # With numba, lines are collected and rasterized straight into the pixel buffer after all grids are drawn
+        pending_lines = [] if _rasterize_polyline is not None else None
+
+        for i, history in enumerate(valid_histories):
+            if i >= len(graph_colors):
+                print(f"Warning: More histories than colors for metric {metric_key}. Reusing colors.")
+            color = graph_colors[i % len(graph_colors)] # Cycle through colors if needed
+
+            # Pass dynamic ranges if applicable
+            self.draw_sparkline_with_grid(
+                draw, history,
+                content_x, graph_y, graph_width, graph_height,
+                color,
+                data_range=data_range_from_config,
+                current_value_for_range=current_total_for_range if metric_key == 'ram_usage' else None,
+                metric_key_debug=metric_key, # Pass key for debug messages inside sparkline
+                disk_range_max_value=disk_dynamic_max if metric_key == 'disk_usage' else None,
+                target_image=cell_image,
+                pending_lines=pending_lines
+            )
+
+        if pending_lines:
+            # np.asarray() of a PIL image is a read-only copy, so draw into a writable copy and load it back
+            pixels = np.array(cell_image)
+            for points, color in pending_lines:
+                if len(points) > 1:
+                    _rasterize_polyline(pixels, points, color[0], color[1], color[2], 2)
+            cell_image.frombytes(pixels.tobytes())
+
+        return cell_image
+
+    def _build_cell_rects(self, size):
+        """
+        Precomputes the static grid geometry for an image size.
+        Returns (cell_rects, filler_boxes): cell_rects is a list of
+        (r, c, metric_key, config, outer_box, cell_values, sub_keys) with outer_box = (x0, y0, x1, y1)
+        and the metric handler pre-resolved; filler_boxes are the strips not covered by any cell.
+        """
+        width, height = size
 
-        padding = 5
         # Ensure division by zero is avoided if grid_cols/rows are somehow 0
         cell_outer_width = width // max(1, self._grid_cols)
         cell_outer_height = height // max(1, self._grid_rows)
 
-        # Get the dynamic disk range max value from the passed data
-        disk_dynamic_max = current_metric_data.get('disk_range_max')
+        # Cells paint their own background; only the strips not covered by the grid need clearing
+        grid_w = cell_outer_width * self._grid_cols
+        grid_h = cell_outer_height * self._grid_rows
+        filler_boxes = []
+        if grid_w < width:
+            filler_boxes.append((grid_w, 0, width, height))
+        if grid_h < height:
+            filler_boxes.append((0, grid_h, width, height))
 
+        cell_rects = []
         for r in range(self._grid_rows):
             for c in range(self._grid_cols):
                 # Defensive check for layout index
@@ -204,163 +734,75 @@ class MonitorGraphicsEngine:
                 # Clamp to image boundaries to prevent drawing errors if grid doesn't fit perfectly
                 cell_outer_x1 = min(width, cell_outer_x0 + cell_outer_width)
                 cell_outer_y1 = min(height, cell_outer_y0 + cell_outer_height)
+                if cell_outer_x1 <= cell_outer_x0 or cell_outer_y1 <= cell_outer_y0:
+                    continue
+
+                cell_values, sub_keys = self._resolve_cell_handler(metric_key, config)
+                cell_rects.append((r, c, metric_key, config, (cell_outer_x0, cell_outer_y0, cell_outer_x1, cell_outer_y1),
+                                   cell_values, sub_keys))
+        return cell_rects, filler_boxes
+
+    @staticmethod
+    def _frame_signature(current_metric_data):
+        """Cheap snapshot of the whole input: HistoryBuffers contribute their version, legacy deques their contents."""
+        signature = []
+        for key, value in current_metric_data.items():
+            if isinstance(value, dict):
+                history = value.get('history')
+                if isinstance(history, HistoryBuffer):
+                    history = (history.version, history.count)
+                elif history is not None:
+                    history = tuple(history)
+                signature.append((key, value.get('current'), history))
+            else:
+                signature.append((key, value))
+        return tuple(signature)
+
+    def draw_frame(self, target_image, current_metric_data):
+        """
+        Draws a complete frame onto the target_image using the provided data.
+        target_image must be mode "RGB": cells are rendered as RGB and the pipeline packs RGB to RGB565,
+        so an alpha channel (RGBA) would only add write bandwidth and a conversion step.
+        """
+        if target_image.mode != "RGB":
+            raise ValueError(f"draw_frame expects an 'RGB' target image, got '{target_image.mode}'.")
+
+        # Same image object, same size and no new data since the last call: it already shows this frame
+        data_signature = self._frame_signature(current_metric_data)
+        if target_image is self._last_target and target_image.size == self._cell_rects_size \
+                and data_signature == self._last_data_signature:
+            return target_image
+        if target_image.size != self._cell_rects_size:
+            if target_image.size != self.resolution:
+                print(f"Warning: Target image size {target_image.size} differs from configured resolution {self.resolution}.")
+                # Proceed with the target image size, drawing might be clipped/misaligned
+            # Geometry depends only on the image size: rebuild it only when the size changes
+            self._cell_rects, self._filler_boxes = self._build_cell_rects(target_image.size)
+            self._cell_rects_size = target_image.size
+
+        for box in self._filler_boxes:
+            target_image.paste(self._c_bg, box)
+
+        # Get the dynamic disk range max value from the passed data
+        disk_dynamic_max = current_metric_data.get('disk_range_max')
+
+        # Cells are rendered serially: Pillow text drawing and the numba rasterizer both hold the GIL,
+        # so a thread pool would only add a handoff per frame
+        for r, c, metric_key, config, (x0, y0, x1, y1), cell_values, sub_keys in self._cell_rects:
+            cell_w = x1 - x0
+            cell_h = y1 - y0
+
+            # Re-render the cell only if its displayed data (or size) changed
+            cell_image, cell_draw = self._get_cell_canvas(r, c, cell_w, cell_h)
+            state_key = (cell_w, cell_h, self._cell_state_key(metric_key, sub_keys, current_metric_data, disk_dynamic_max))
+            if self._cell_cache.get((r, c)) != state_key:
+                self._render_cell(metric_key, config, cell_values, cell_image, cell_draw, current_metric_data, disk_dynamic_max)
+                self._cell_cache[(r, c)] = state_key
+
+            # Pasting is a plain memcpy, so it is done every frame (the target may be a fresh canvas)
+            target_image.paste(cell_image, (x0, y0))
+
+        self._last_target = target_image
+        self._last_data_signature = data_signature
 
-                # Draw cell border
-                draw.rectangle([cell_outer_x0, cell_outer_y0, cell_outer_x1, cell_outer_y1],
-                               outline=self._colors["cell_border"], width=2)
-
-                # Content area within cell
-                content_x = cell_outer_x0 + padding
-                content_y = cell_outer_y0 + padding
-                content_width = max(0, (cell_outer_x1 - cell_outer_x0) - 2 * padding)
-                content_height = max(0, (cell_outer_y1 - cell_outer_y0) - 2 * padding)
-
-                if content_width <= 0 or content_height <= 0:
-                    continue # Skip drawing content if cell is too small
-
-                # --- Text and Graph Rendering (mostly same as before) ---
-                title = config["title"]
-                unit = config.get("unit", "")
-                data_range_from_config = config.get("range")
-
-                # Title
-                title_y = content_y + 5
-                draw.text((content_x + 5, title_y), title, fill=self._colors["foreground"], font=self._font_title)
-
-                # Value Area Start
-                value_area_y_start = title_y + self._font_title.size + 10 # Use font size directly
-
-                # Prepare variables
-                value_text = "N/A"
-                unit_text = ""
-                unit_color = self._colors["value_color"]
-                graph_colors = []
-                graph_histories = []
-                current_total_for_range = None # Specifically for RAM total
-
-                # --- Get data from current_metric_data ---
-                if metric_key == "disk_usage":
-                    # Disk: Read/Write
-                    read_data = current_metric_data.get('disk_read', {})
-                    write_data = current_metric_data.get('disk_write', {})
-                    current_read = read_data.get('current')
-                    current_write = write_data.get('current')
-
-                    # Format values (use helper functions)
-                    val_read_str = format_bytes_per_second(current_read, 0).replace('/s','')
-                    val_write_str = format_bytes_per_second(current_write, 0).replace('/s','')
-                    value_text = f"{val_read_str} R\n{val_write_str} W"
-                    unit_text = "B/s" # Base unit text
-
-                    # Graph data
-                    graph_colors = [config.get("color_read", self._colors["graph_line"]),
-                                    config.get("color_write", self._colors["graph_line"])]
-                    graph_histories = [read_data.get('history', deque([0.0]*self._history_length, maxlen=self._history_length)),
-                                       write_data.get('history', deque([0.0]*self._history_length, maxlen=self._history_length))]
-
-                elif metric_key == "ram_usage":
-                    # RAM: Used/Total
-                    used_data = current_metric_data.get('ram_used', {})
-                    total_data = current_metric_data.get('ram_total', {}) # Total is stored differently
-                    current_used = used_data.get('current')
-                    # Total RAM is usually static, get the single value from its 'history' deque
-                    # Provide a default list [0.0] if key/history is missing
-                    total_history = total_data.get('history', deque([0.0], maxlen=1))
-                    current_total_val = total_history[0] if total_history else 0.0
-
-                    if current_used is not None and current_total_val is not None and \
-                       not math.isnan(current_used) and not math.isnan(current_total_val) and current_total_val > 0:
-                        # Format value (use helper function)
-                        used_gb_str = format_bytes(current_used, 1).replace(' GB', '')
-                        # total_gb_str = format_bytes(current_total_val, 1) # Could display total too
-                        value_text = f"{used_gb_str}"
-                        unit_text = "GB"
-                        current_total_for_range = current_total_val # Pass total for dynamic range
-                        graph_colors = [config.get("color", self._colors["graph_line"])]
-                        graph_histories = [used_data.get('history', deque([0.0]*self._history_length, maxlen=self._history_length))]
-                    else:
-                        value_text = "N/A"
-                        unit_color = self._colors["error"]
-                        graph_colors = [config.get("color", self._colors["graph_line"])]
-                        # Provide default history on error to prevent crash in sparkline
-                        graph_histories = [deque([0.0] * self._history_length, maxlen=self._history_length)]
-
-                else:
-                    # Single value metrics (GPU Load, GPU RAM %, GPU Temp, CPU Load)
-                    metric_data = current_metric_data.get(metric_key, {})
-                    current_val = metric_data.get('current')
-
-                    if current_val is not None and not (isinstance(current_val, float) and math.isnan(current_val)):
-                        # Format based on unit
-                        if unit == "%": value_text = f"{current_val:.0f}"
-                        elif unit == "°C": value_text = f"{current_val:.0f}"
-                        else: value_text = f"{current_val:.1f}" # Default formatting
-                        unit_text = unit
-                    else:
-                        value_text = "N/A"
-                        unit_color = self._colors["error"]
-
-                    graph_colors = [config.get("color", self._colors["graph_line"])]
-                    # Provide default history on error
-                    graph_histories = [metric_data.get('history', deque([0.0]*self._history_length, maxlen=self._history_length))]
-
-
-                # Draw Value Text
-                # Use textbbox for potentially better sizing with multi-line text (like Disk R/W)
-                value_bbox = draw.textbbox((content_x + 10, value_area_y_start), value_text, font=self._font_value, anchor="la", align="left", spacing=0)
-                value_width = value_bbox[2] - value_bbox[0]
-                value_height = value_bbox[3] - value_bbox[1]
-                value_x = content_x + 10
-                value_y = value_area_y_start
-
-                draw.text((value_x, value_y), value_text, fill=unit_color, font=self._font_value, anchor="la", align="left") # Use 'la' anchor (left, baseline of first line)
-
-                # Draw Unit Text (if present)
-                if unit_text:
-                    # Position unit relative to the bounding box of the value text
-                    unit_bbox = draw.textbbox((0, 0), unit_text, font=self._font_unit, anchor="ls") # Left, top
-                    unit_width = unit_bbox[2] - unit_bbox[0]
-                    # unit_height = unit_bbox[3] - unit_bbox[1] # Not usually needed for positioning
-
-                    unit_x = value_x + value_width + 5  # Position after value text
-                    unit_y = value_y + value_height      # Align baseline with bottom of value text bbox
-
-                    # Prevent unit from going off the right edge
-                    if unit_x + unit_width > content_x + content_width - 5:
-                        unit_x = content_x + content_width - unit_width - 5 # Adjust to fit
-
-                    # Draw unit text using 'ls' anchor (left, baseline)
-                    draw.text((unit_x, unit_y), unit_text, fill=unit_color, font=self._font_unit, anchor="ls")
-
-
-                # Graph Area Calculation
-                graph_area_y_start = value_y + value_height + 15 # Space below value text
-                graph_height = max(10, (content_y + content_height) - graph_area_y_start - 5) # Remaining height
-                graph_y = graph_area_y_start
-                graph_width = content_width # Use full content width
-
-                # Draw Sparkline(s)
-                # Ensure histories are valid deques before iterating
-                valid_histories = [h for h in graph_histories if isinstance(h, deque)]
-
-                if not graph_colors:
-                     print(f"ERROR: graph_colors list is empty for metric {metric_key}")
-                     continue # Skip drawing graph if no colors defined
-
-                for i, history in enumerate(valid_histories):
-                    if i >= len(graph_colors):
-                        print(f"Warning: More histories than colors for metric {metric_key}. Reusing colors.")
-                    color = graph_colors[i % len(graph_colors)] # Cycle through colors if needed
-
-                    # Pass dynamic ranges if applicable
-                    self.draw_sparkline_with_grid(
-                        draw, history,
-                        content_x, graph_y, graph_width, graph_height,
-                        color,
-                        data_range=data_range_from_config,
-                        current_value_for_range=current_total_for_range if metric_key == 'ram_usage' else None,
-                        metric_key_debug=metric_key, # Pass key for debug messages inside sparkline
-                        disk_range_max_value=disk_dynamic_max if metric_key == 'disk_usage' else None
-                    )
-
-        return target_image # Return the modified image
\ No newline at end of file
+        return target_image # Return the modified image
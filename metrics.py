@@ -54,6 +54,13 @@ FRAMES_GENERATED_TOTAL = Counter(
     labelnames=['pipeline_name']
 )
 
+# Количество кадров, замещенных в слоте более свежим до того, как потребитель их забрал
+FRAMES_DROPPED_TOTAL = Counter(
+    'esp32_frames_dropped_total',
+    'Общее количество сгенерированных кадров, замещенных более свежим кадром до обработки потребителем',
+    labelnames=['pipeline_name']
+)
+
 # Количество кадров, успешно обработанных и (попытка) отправленных потоком-потребителем
 FRAMES_PROCESSED_TOTAL = Counter(
     'esp32_frames_processed_total',
@@ -107,6 +114,7 @@ ALL_METRICS = {
     'connection_errors_total': CONNECTION_ERRORS_TOTAL,
     'reconnections_total': RECONNECTIONS_TOTAL,
     'frames_generated_total': FRAMES_GENERATED_TOTAL,
+    'frames_dropped_total': FRAMES_DROPPED_TOTAL,
     'frames_processed_total': FRAMES_PROCESSED_TOTAL,
     'frames_queue_size': FRAMES_QUEUE_SIZE,
     # 'frames_queue_current_size': FRAMES_QUEUE_CURRENT_SIZE, # Если используете Gauge для текущего размера
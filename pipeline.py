@@ -1,14 +1,18 @@
 # pipeline.py
+import os
 import socket
+import selectors
 import threading
 import queue
 import time
+import sys
+import traceback
 from PIL import Image, ImageDraw # ImageDraw для заглушки при ошибке
 import struct
 import numpy as np
 from collections import deque
 import mss # Для SCREEN_CAPTURE
-from numba import jit, types
+from numba import jit
 
 
 # Импорт ваших генераторов
@@ -20,69 +24,233 @@ from window_capture import WindowScreenshotter
 
 # from graphics_engine import MonitorGraphicsEngine # Если используется напрямую
 
-# Вспомогательная функция для преобразования RGB в RGB565
-@jit(nopython=True)
-def rgb_to_rgb565(r, g, b):
-    """Преобразует значения R, G, B в 16-битный формат RGB565."""
-    return ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
-
-# The decorator's return type signature is now corrected
-@jit(types.UniTuple(types.UniTuple(types.float32, 3), 2)(types.float32, types.float32, types.float32), nopython=True)
-def _quantize_and_get_error_numba(r, g, b):
-    # This part of the code remains the same as the logic is sound
-    
-    new_r = round(r / 8.0) * 8.0
-    if new_r < 0.0: new_r = 0.0
-    if new_r > 255.0: new_r = 255.0
-
-    new_g = round(g / 4.0) * 4.0
-    if new_g < 0.0: new_g = 0.0
-    if new_g > 255.0: new_g = 255.0
-    
-    new_b = round(b / 8.0) * 8.0
-    if new_b < 0.0: new_b = 0.0
-    if new_b > 255.0: new_b = 255.0
-    
-    error_r = r - new_r
-    error_g = g - new_g
-    error_b = b - new_b
-    
-    # The return statement's structure remains correct
-    return (new_r, new_g, new_b), (error_r, error_g, error_b)
-
-# This function remains without changes
-@jit(nopython=True)
-def _apply_dithering_numba(pixels, width, height):
+# Максимум буферов в одном вызове sendmsg (IOV_MAX в Linux — 1024)
+SENDMSG_MAX_BUFFERS = 512
+# Интервал (с), в течение которого повтор того же исключения логируется без стека, см. StreamPipeline._log_exception
+TRACEBACK_REPEAT_INTERVAL_SEC = 10.0
+
+# Заголовок пакета обновления: x, y, w, h (uint16) и длина данных (uint32), big-endian.
+# Формат разбирается один раз при импорте, а не при каждом struct.pack
+UPDATE_HEADER = struct.Struct('!HHHH I')
+# Старший бит поля длины: данные — разреженная дельта, пары (индекс пикселя в прямоугольнике uint16, цвет RGB565)
+SPARSE_DELTA_FLAG = 0x80000000
+
+@jit(nopython=True, cache=True, boundscheck=False)
+def _dither_plane_numba(plane, shift):
+    """
+    Floyd–Steinberg на месте для одного канала (плоскость H x W, int16) с шагом квантования 1 << shift
+    (8 для R/B — 5 бит, 4 для G — 6 бит). Каналы при диффузии ошибки не смешиваются, поэтому каждая
+    плоскость обрабатывается отдельно: чтения и записи идут по соседним скалярам одной строки.
+    Целочисленная арифметика: доли ошибки 7/16, 3/16, 5/16 — сдвигами, а доля 1/16 получает остаток,
+    чтобы ошибка не терялась при округлении.
+    """
+    height, width = plane.shape[0], plane.shape[1]
+    half = 1 << (shift - 1)
     for y in range(height):
+        row = plane[y]
+        has_next_row = y < height - 1
+        next_row = plane[y + 1] if has_next_row else row
         for x in range(width):
-            old_r, old_g, old_b = pixels[y, x]
-            
-            (new_r, new_g, new_b), (error_r, error_g, error_b) = _quantize_and_get_error_numba(old_r, old_g, old_b)
-            
-            pixels[y, x] = (new_r, new_g, new_b)
-            
+            old = np.int32(row[x])
+            new = ((old + half) >> shift) << shift
+            if new < 0:
+                new = 0
+            elif new > 255:
+                new = 255
+            error = old - new
+            row[x] = new
+
+            error_right = (error * 7) >> 4
+            error_down_left = (error * 3) >> 4
+            error_down = (error * 5) >> 4
+            error_down_right = error - error_right - error_down_left - error_down
+
             if x < width - 1:
-                pixels[y, x + 1, 0] += error_r * 7 / 16.0
-                pixels[y, x + 1, 1] += error_g * 7 / 16.0
-                pixels[y, x + 1, 2] += error_b * 7 / 16.0
-            
-            if y < height - 1:
+                row[x + 1] += error_right
+            if has_next_row:
                 if x > 0:
-                    pixels[y + 1, x - 1, 0] += error_r * 3 / 16.0
-                    pixels[y + 1, x - 1, 1] += error_g * 3 / 16.0
-                    pixels[y + 1, x - 1, 2] += error_b * 3 / 16.0
-                
-                pixels[y + 1, x, 0] += error_r * 5 / 16.0
-                pixels[y + 1, x, 1] += error_g * 5 / 16.0
-                pixels[y + 1, x, 2] += error_b * 5 / 16.0
-                
+                    next_row[x - 1] += error_down_left
+                next_row[x] += error_down
                 if x < width - 1:
-                    pixels[y + 1, x + 1, 0] += error_r * 1 / 16.0
-                    pixels[y + 1, x + 1, 1] += error_g * 1 / 16.0
-                    pixels[y + 1, x + 1, 2] += error_b * 1 / 16.0
+                    next_row[x + 1] += error_down_right
 
+@jit(nopython=True, cache=True, boundscheck=False)
+def _pack_rgb565_planes_numba(planes, out16, swap_bytes):
+    """
+    Упаковывает квантованные плоскости R, G, B (3 x H x W) в RGB565 в out16 (uint16, >= H*W) одним проходом.
+    swap_bytes=True на little-endian хосте: перестановка байт в регистре дает big-endian порядок в памяти.
+    """
+    height, width = planes.shape[1], planes.shape[2]
+    for y in range(height):
+        row = y * width
+        for x in range(width):
+            value = ((np.int32(planes[0, y, x]) & 0xF8) << 8) | ((np.int32(planes[1, y, x]) & 0xFC) << 3) | (np.int32(planes[2, y, x]) >> 3)
+            if swap_bytes:
+                value = ((value & 0xFF) << 8) | (value >> 8)
+            out16[row + x] = value
+
+@jit(nopython=True, cache=True)
+def _apply_dithering_numba(planes, out16, swap_bytes):
+    """
+    Дизеринг Floyd–Steinberg на месте для плоскостей R, G, B (3 x H x W, int16) с упаковкой
+    в big-endian RGB565 прямо в out16 (uint16, >= H*W).
+    Плоскости обрабатываются последовательно: ядро одновременно вызывают потребители всех пайплайнов,
+    а параллельные запуски numba из разных потоков на слое workqueue по умолчанию не потокобезопасны;
+    prange на 3 итерации к тому же почти ничего не выигрывает.
+    """
+    for channel in range(3):
+        _dither_plane_numba(planes[channel], 2 if channel == 1 else 3)
+    _pack_rgb565_planes_numba(planes, out16, swap_bytes)
+
+@jit(nopython=True, cache=True, boundscheck=False)
+def _pack_rgb565_lut_numba(arr, lut_r, lut_g, lut_b, out16):
+    """
+    Упаковка uint8-массива H x W x 3 в RGB565 по поканальным uint16-таблицам (_rgb565_luts) за один проход:
+    каждый пиксель читается один раз и сразу пишется в out16 (uint16, >= H*W), без временных массивов.
+    Внутренний цикл непрерывен по x, LLVM векторизует его (AVX2/NEON) без ручных intrinsics.
+    """
+    height, width = arr.shape[0], arr.shape[1]
+    for y in range(height):
+        row = y * width
+        for x in range(width):
+            out16[row + x] = lut_r[arr[y, x, 0]] | lut_g[arr[y, x, 1]] | lut_b[arr[y, x, 2]]
+
+# Порядок байт хоста: ESP32 ждет RGB565 в big-endian
+_RGB565_SWAP_BYTES = sys.byteorder == 'little'
+
+@jit(nopython=True, cache=True, boundscheck=False)
+def _tile_diff_numba(prev, curr, tile_size, threshold, tile_mask, row_mask):
+    """
+    Один проход по двум uint8-кадрам H x W x 3: пиксель изменен, если сумма |curr - prev| по каналам > threshold.
+    Отмечает тайлы tile_size x tile_size с изменениями в tile_mask (ceil(H/t), ceil(W/t)) и строки с изменениями
+    в row_mask (H) — это проекция маски на ось Y. Возвращает (min_x, max_x) — проекцию на ось X;
+    max_x == -1, если изменений нет. Без промежуточных int16-массивов, маски пикселей и np.where-координат.
+    """
+    height, width = curr.shape[0], curr.shape[1]
+    min_x, max_x = width, -1
+    for y in range(height):
+        tile_row = tile_mask[y // tile_size]
+        row_min_x, row_max_x = width, -1
+        for x in range(width):
+            diff = (abs(np.int32(curr[y, x, 0]) - np.int32(prev[y, x, 0]))
+                    + abs(np.int32(curr[y, x, 1]) - np.int32(prev[y, x, 1]))
+                    + abs(np.int32(curr[y, x, 2]) - np.int32(prev[y, x, 2])))
+            if diff > threshold:
+                tile_row[x // tile_size] = True
+                if row_max_x < 0: row_min_x = x
+                row_max_x = x
+        # Границы по X обновляются раз на строку, а не на каждый измененный пиксель
+        if row_max_x >= 0:
+            row_mask[y] = True
+            if row_min_x < min_x: min_x = row_min_x
+            if row_max_x > max_x: max_x = row_max_x
+    return min_x, max_x
+
+_numba_warmup_lock = threading.Lock()
+_numba_warmed_up = False
+
+def _warmup_numba_kernels():
+    """
+    Компилирует numba-ядра на крошечных массивах тех же типов и раскладок, что и в рабочем цикле.
+    Без этого JIT (или загрузка из cache=True) происходит на первом кадре после подключения клиента,
+    и пауза в сотни мс выглядит для ESP32 как зависание. Выполняется один раз на процесс.
+    """
+    global _numba_warmed_up
+    with _numba_warmup_lock:
+        if _numba_warmed_up:
+            return
+        frame = np.zeros((4, 4, 3), dtype=np.uint8)
+        out16 = np.empty(16, dtype=np.uint16)
+        _apply_dithering_numba(np.zeros((3, 4, 4), dtype=np.int16), out16, _RGB565_SWAP_BYTES)
+        lut = np.zeros(256, dtype=np.uint16)
+        _pack_rgb565_lut_numba(frame, lut, lut, lut, out16)
+        _pack_rgb565_lut_numba(frame[:2, :2], lut, lut, lut, out16[:4]) # Срез кадра — другая раскладка памяти
+        _tile_diff_numba(frame, frame.copy(), 2, 0, np.zeros((2, 2), dtype=np.bool_), np.zeros(4, dtype=np.bool_))
+        # SCREEN_CAPTURE без ресэмплинга отдает представление BGRA-буфера mss (bytearray) с обратным шагом
+        # по каналам — это отдельная специализация; строим кадр той же функцией, что и рабочий путь
+        capture_prev = StreamPipeline._bgra_buffer_to_rgb_array(bytearray(4 * 4 * 4), 4, 4)
+        capture_curr = StreamPipeline._bgra_buffer_to_rgb_array(bytearray(4 * 4 * 4), 4, 4)
+        _tile_diff_numba(capture_prev, capture_curr, 2, 0, np.zeros((2, 2), dtype=np.bool_), np.zeros(4, dtype=np.bool_))
+        _pack_rgb565_lut_numba(capture_curr, lut, lut, lut, out16)
+        _numba_warmed_up = True
+
+def _split_rect_by_rows(rect, row_mask, min_gap):
+    """
+    Делит прямоугольник (x, y, w, h) по строкам без изменений (row_mask — флаги строк кадра):
+    возвращает подпрямоугольники только с измененными строками. Промежутки короче min_gap строк
+    не разрезаются — лишний заголовок и pushImage на ESP32 стоят дороже нескольких строк пикселей.
+    """
+    x, y, w, h = rect
+    edges = np.diff(np.concatenate(([0], row_mask[y:y + h].view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1).tolist()
+    ends = np.flatnonzero(edges == -1).tolist()
+    if not starts:
+        return []
+    parts = []
+    run_start, run_end = starts[0], ends[0]
+    for start, end in zip(starts[1:], ends[1:]):
+        if start - run_end < min_gap:
+            run_end = end
+        else:
+            parts.append((x, y + run_start, w, run_end - run_start))
+            run_start, run_end = start, end
+    parts.append((x, y + run_start, w, run_end - run_start))
+    return parts
+
+def _merge_tile_runs(tile_mask):
+    """
+    Объединяет грязные тайлы в прямоугольники: непрерывные отрезки в строке тайлов,
+    а одинаковые отрезки в соседних строках склеиваются по вертикали.
+    Возвращает список (tx0, ty0, tx1, ty1) в единицах тайлов (правая/нижняя граница не включается).
+    """
+    rects = []
+    open_runs = {} # (tx0, tx1) -> ty0 отрезка, который еще продолжается
+    for ty in range(tile_mask.shape[0]):
+        edges = np.diff(np.concatenate(([0], tile_mask[ty].view(np.int8), [0])))
+        runs = set(zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()))
+        for run, ty0 in list(open_runs.items()):
+            if run not in runs:
+                rects.append((run[0], ty0, run[1], ty))
+                del open_runs[run]
+        for run in runs:
+            open_runs.setdefault(run, ty)
+    for run, ty0 in open_runs.items():
+        rects.append((run[0], ty0, run[1], tile_mask.shape[0]))
+    return rects
+
+class LatestFrameSlot:
+    """
+    Одноместный слот "последний кадр" между генератором и потребителем: новый кадр замещает
+    еще не забранный старый, поэтому потребитель всегда берет самый свежий и задержка не копится.
+    Интерфейс повторяет нужную часть queue.Queue (get с таймаутом бросает queue.Empty).
+    """
+    def __init__(self):
+        self._frame = None
+        self._cond = threading.Condition()
+
+    def put(self, frame) -> bool:
+        """Кладет кадр, не блокируясь; возвращает True, если при этом был выброшен незабранный кадр."""
+        with self._cond:
+            dropped = self._frame is not None
+            self._frame = frame
+            self._cond.notify()
+        return dropped
+
+    def get(self, timeout: float | None = None):
+        """Забирает кадр, ожидая до timeout секунд; если кадра нет — queue.Empty."""
+        with self._cond:
+            if self._frame is None and not self._cond.wait_for(lambda: self._frame is not None, timeout):
+                raise queue.Empty
+            frame, self._frame = self._frame, None
+        return frame
+
+    def qsize(self) -> int:
+        return 0 if self._frame is None else 1
+
+    def clear(self):
+        with self._cond:
+            self._frame = None
 
-            
 class StreamPipeline:
     """
     Управляет одним потоковым пайплайном: прослушивание порта, генерация кадров,
@@ -94,13 +262,36 @@ class StreamPipeline:
         self.port = self.config['esp32_port'] # Обязательный параметр
         self.global_server_stop_event = global_server_stop_event
         self.metrics = prometheus_metrics_objects # Словарь с объектами метрик Prometheus
-
-        self.frames_queue = queue.Queue(maxsize=self.config.get('frames_queue_max_size', 5))
+        # Дочерние метрики с меткой pipeline_name создаются один раз: .labels() на каждом чанке —
+        # поиск по словарю под блокировкой, самая дорогая часть вызова в prometheus_client
+        self._bound_metrics = {
+            key: metric.labels(pipeline_name=self.name)
+            for key, metric in self.metrics.items() if key != 'frame_processing_time'
+        }
+        # stage -> frame_processing_time.labels(stage=..., pipeline_name=...); стадии горячего пути привязываются сразу,
+        # стадия генератора (generate_<режим>) — при первом обращении
+        self._stage_metrics = {
+            stage: self.metrics['frame_processing_time'].labels(stage=stage, pipeline_name=self.name)
+            for stage in ('color_correction', 'rgb565_conversion', 'diff_calculation', 'packet_packing',
+                          'resize_thread', 'full_consumer_loop_thread')
+        }
+        self._last_traceback_key = None # (тип, текст) последнего исключения, выведенного со стеком, см. _log_exception
+        self._last_traceback_time = 0.0
+        self._frame_stage_ns = {} # stage -> нс за текущий кадр (поток потребителя), см. _add_stage_ns
+
+        self.frames_queue = LatestFrameSlot() # Только самый свежий кадр: старые для живого потока бесполезны
         self.pipeline_internal_stop_event = threading.Event() # Для остановки генератора/потребителя этого пайплайна
+        # Сессия клиента закончилась: потребитель вышел или пришла глобальная остановка (см. stop_pipeline_manager).
+        # Менеджер ждет это событие одним блокирующим wait(), без опроса join(timeout)
+        self._session_done_event = threading.Event()
 
         self.server_socket = None # Серверный сокет для прослушивания
         self.client_connection = None # Активное соединение с клиентом
         self.manager_thread = None # Поток, в котором выполняется _listening_loop
+        # Канал пробуждения менеджера: stop_pipeline_manager пишет байт, и select() в _listening_loop
+        # возвращается сразу, без опроса accept с таймаутом. Создается и закрывается самим _listening_loop
+        self._wakeup_reader = None
+        self._wakeup_writer = None
 
         self._generator_thread = None # Поток для _generator_loop
         self._consumer_thread = None  # Поток для _consumer_loop
@@ -108,16 +299,58 @@ class StreamPipeline:
         self._sct_instance_local_to_generator_thread = None # Экземпляр mss.mss(), создаваемый в потоке генератора
 
         # Состояние для потребителя, сбрасывается для каждой новой сессии клиента
-        self._prev_processed_image = None
+        self._prev_processed_array = None # Последний отправленный кадр как uint8-массив (H, W, 3)
         self._current_dynamic_threshold = self.config.get('min_dirty_rect_threshold', 10)
         self._frame_processing_times_history = deque(maxlen=self.config.get('fps_history_size', 10))
 
+        # LUT для гаммы и баланса белого (конфигурация неизменна в течение жизни пайплайна)
+        self._build_color_luts()
+        # Буфер RGB565 на весь кадр: чанки кадра пишутся в него подряд и отправляются как memoryview-срезы
+        self._rgb565_frame_buffer = np.empty(self.config['target_width'] * self.config['target_height'] * 2, dtype=np.uint8)
+        # RGB565 всего кадра после дизеринга (big-endian в памяти); прямоугольники копируются из него
+        self._dithered_frame_buffer = np.empty(self.config['target_width'] * self.config['target_height'] * 2, dtype=np.uint8)
+        self._scratch_planes = None # int16-плоскости каналов для дизеринга, см. _get_scratch_planes
+
         self._log(f"Экземпляр Pipeline создан для порта {self.port}.")
 
+    def _add_stage_ns(self, stage: str, start_ns: int):
+        """
+        Добавляет время стадии (от start_ns по perf_counter_ns) к сумме текущего кадра. Стадии, вызываемые
+        на каждом чанке, не трогают гистограмму: суммы наблюдаются один раз в конце кадра (_flush_stage_times).
+        """
+        self._frame_stage_ns[stage] = self._frame_stage_ns.get(stage, 0) + time.perf_counter_ns() - start_ns
+
+    def _flush_stage_times(self):
+        """Отправляет накопленные за кадр времена стадий в frame_processing_time (по одному observe на стадию)."""
+        for stage, elapsed_ns in self._frame_stage_ns.items():
+            self._stage_metric(stage).observe(elapsed_ns * 1e-9)
+        self._frame_stage_ns.clear()
+
+    def _stage_metric(self, stage: str):
+        """Дочерняя метрика frame_processing_time для стадии (создается при первом обращении)."""
+        metric = self._stage_metrics.get(stage)
+        if metric is None:
+            metric = self._stage_metrics[stage] = self.metrics['frame_processing_time'].labels(stage=stage, pipeline_name=self.name)
+        return metric
+
     def _log(self, message, level="INFO"):
         """Логирование сообщений с именем пайплайна."""
         print(f"[{level}][{self.name}] {message}")
 
+    def _log_exception(self, message):
+        """
+        Логирует ошибку вместе со стеком текущего исключения. Повтор того же исключения чаще, чем раз в
+        TRACEBACK_REPEAT_INTERVAL_SEC, логируется без стека: при "шторме" ошибок (например, генератор падает
+        каждые 0.1 с) форматирование стека не отнимает время у рабочих потоков и не забивает вывод.
+        """
+        self._log(message, "ERROR")
+        exc_type, exc, _ = sys.exc_info()
+        key = (exc_type, str(exc))
+        now = time.monotonic()
+        if key != self._last_traceback_key or now - self._last_traceback_time >= TRACEBACK_REPEAT_INTERVAL_SEC:
+            self._last_traceback_key, self._last_traceback_time = key, now
+            traceback.print_exc()
+
     def _initialize_generator_instance(self):
         """Инициализирует или переинициализирует конкретный генератор изображений."""
         self._log("Инициализация настроек для генератора...")
@@ -172,153 +405,340 @@ class StreamPipeline:
             self._log(f"Настройки для генератора '{source_mode}' успешно подготовлены.")
             return True
         except Exception as e:
-            self._log(f"КРИТИЧЕСКАЯ ОШИБКА подготовки генератора для '{source_mode}': {e}", "ERROR")
-            import traceback
-            traceback.print_exc()
+            self._log_exception(f"КРИТИЧЕСКАЯ ОШИБКА подготовки генератора для '{source_mode}': {e}")
             return False
 
-    def _apply_gamma_and_white_balance(self, img: Image.Image) -> Image.Image:
-        """Применяет гамма-коррекцию и баланс белого к изображению."""
-        if img.mode != 'RGB': img = img.convert('RGB')
-        img_array = np.array(img, dtype=np.float32) / 255.0
-        
+    def _build_color_luts(self):
+        """
+        Предвычисляет таблицы (LUT) на 256 значений для гаммы + баланса белого:
+        self._color_lut (3, 256) uint8 — скорректированное значение канала (для пути с дизерингом),
+        self._rgb565_luts — по одной uint16 таблице на канал, уже сдвинутой в свою позицию RGB565.
+        """
         gamma = self.config.get('gamma', 1.0)
-        img_corrected = np.power(img_array, gamma)
-        
         wb_scale_config = self.config.get('wb_scale', (1.0, 1.0, 1.0))
         if not (isinstance(wb_scale_config, (list, tuple)) and len(wb_scale_config) == 3):
             self._log(f"Некорректный формат wb_scale: {wb_scale_config}. Используется (1.0, 1.0, 1.0).", "WARN")
             wb_scale_config = (1.0, 1.0, 1.0)
-            
-        scale_np = np.array(wb_scale_config).reshape(1, 1, 3)
-        img_balanced = img_corrected * scale_np
-        
-        img_final_np = np.clip(img_balanced * 255.0, 0, 255).astype(np.uint8)
-
-        # Меняем местами 0-й (R) и 2-й (B) каналы
-        # Способ 1: Явное присваивание (возможно, безопаснее)
 
-        return Image.fromarray(img_final_np, 'RGB')
-
-    def _apply_dithering_to_rgb565_bytes(self, img: Image.Image) -> bytes:
-        processing_start_time = time.monotonic()
+        levels = np.arange(256, dtype=np.float64) / 255.0
+        if isinstance(gamma, str) and gamma.lower() == 'srgb':
+            # Точная кусочная кривая sRGB -> линейный свет (линейный участок у черного + степень 2.4)
+            curve = np.where(levels <= 0.04045, levels / 12.92, np.power((levels + 0.055) / 1.055, 2.4))
+        else:
+            try:
+                curve = np.power(levels, float(gamma))
+            except (TypeError, ValueError):
+                self._log(f"Некорректное значение gamma: {gamma}. Используется 1.0.", "WARN")
+                curve = levels
+        corrected = curve[np.newaxis, :] * np.array(wb_scale_config, dtype=np.float64).reshape(3, 1)
+        color_lut = np.clip(corrected * 255.0, 0, 255).astype(np.uint8) # Усечение, как в прежнем astype(np.uint8)
+
+        lut16 = color_lut.astype(np.uint16)
+        rgb565_luts = ((lut16[0] & 0xF8) << 8, (lut16[1] & 0xFC) << 3, lut16[2] >> 3)
+        if _RGB565_SWAP_BYTES:
+            # Битовые поля каналов не пересекаются, поэтому swap(r | g | b) == swap(r) | swap(g) | swap(b):
+            # перестановка байт заранее зашита в таблицы, и результат OR уже лежит в памяти в big-endian
+            rgb565_luts = tuple(lut.byteswap() for lut in rgb565_luts)
+
+        # Таблицы сначала строятся целиком и только потом подменяются: поток потребителя может читать их в этот момент
+        self._color_lut = color_lut
+        self._color_lut_i16 = color_lut.astype(np.int16) # Для np.take прямо в int16-плоскости дизеринга
+        # Тождественная коррекция (gamma=1, wb=1,1,1): таблицу можно не применять вовсе
+        self._color_lut_is_identity = bool(np.array_equal(color_lut, np.broadcast_to(np.arange(256, dtype=np.uint8), (3, 256))))
+        self._rgb565_luts = rgb565_luts
+
+    def set_color_correction(self, gamma: float | str | None = None, wb_scale=None):
+        """Меняет гамму и/или баланс белого на лету и перестраивает LUT; None — оставить текущее значение."""
+        if gamma is not None:
+            self.config['gamma'] = gamma
+        if wb_scale is not None:
+            self.config['wb_scale'] = tuple(wb_scale)
+        self._build_color_luts()
+        self._log(f"Цветокоррекция обновлена: gamma={self.config.get('gamma', 1.0)}, wb_scale={self.config.get('wb_scale', (1.0, 1.0, 1.0))}.")
+
+    @staticmethod
+    def _as_rgb_array(img) -> np.ndarray:
+        """Возвращает uint8-массив H x W x 3: ndarray (в т.ч. срез кадра) проходит без копии, PIL Image конвертируется."""
+        if isinstance(img, np.ndarray):
+            return img
+        if img.mode != 'RGB': img = img.convert('RGB')
+        return np.asarray(img)
+
+    def _get_scratch_planes(self, height: int, width: int) -> np.ndarray:
+        """Переиспользуемые int16-плоскости 3 x H x W для дизеринга; пересоздаются только при смене размера."""
+        if self._scratch_planes is None or self._scratch_planes.shape[1:] != (height, width):
+            self._scratch_planes = np.empty((3, height, width), dtype=np.int16)
+        return self._scratch_planes
+
+    def _apply_color_lut_planes(self, arr: np.ndarray) -> np.ndarray:
+        """
+        Гамма + баланс белого по LUT для uint8-массива H x W x 3; результат — int16-плоскости каналов 3 x H x W
+        в переиспользуемом буфере (действителен до следующего вызова).
+        """
+        planes = self._get_scratch_planes(*arr.shape[:2])
+        if self._color_lut_is_identity:
+            np.copyto(planes, arr.transpose(2, 0, 1))
+            return planes
+        for channel in range(3):
+            # take с out пишет результат прямо в плоскость, без временного массива
+            np.take(self._color_lut_i16[channel], arr[..., channel], out=planes[channel], mode='clip')
+        return planes
+
+    def _apply_color_lut(self, arr: np.ndarray, dtype=np.uint8) -> np.ndarray:
+        """Гамма + баланс белого по LUT для uint8-массива H x W x 3; результат сразу в нужном dtype."""
+        if self._color_lut_is_identity:
+            return arr if dtype == np.uint8 else arr.astype(dtype)
+        out = np.empty(arr.shape, dtype=dtype)
+        for channel in range(3):
+            out[..., channel] = self._color_lut[channel][arr[..., channel]]
+        return out
+
+    def _apply_gamma_and_white_balance(self, arr: np.ndarray) -> np.ndarray:
+        """Применяет гамма-коррекцию и баланс белого к uint8-массиву H x W x 3 (через предвычисленные LUT), без обертки в PIL Image."""
+        return self._apply_color_lut(self._as_rgb_array(arr))
+
+    def _apply_dithering_to_rgb565_bytes(self, img, out: np.ndarray | None = None):
+        """
+        Дизеринг и упаковка в RGB565. img — PIL Image или uint8-массив H x W x 3 (например, срез кадра без копии).
+        Если передан out (uint8-срез длиной W*H*2), данные пишутся в него и возвращается memoryview без копии;
+        иначе возвращаются новые bytes.
+        """
+        processing_start_ns = time.perf_counter_ns()
+        arr = self._as_rgb_array(img)
         try:
-            processed_img = self._apply_gamma_and_white_balance(img)
+            # LUT пишет сразу в int16-плоскости каналов для дизеринга: без промежуточного uint8-изображения,
+            # вдвое меньше памяти, чем float32
+            planes = self._apply_color_lut_planes(arr)
         except Exception as e:
             self._log(f"Ошибка при применении гаммы/ББ: {e}. Используется исходное изображение.", "WARN")
-            processed_img = img.convert('RGB') if img.mode != 'RGB' else img
-        self.metrics['frame_processing_time'].labels(stage='color_correction', pipeline_name=self.name).observe(time.monotonic() - processing_start_time)
-
-        conversion_start_time = time.monotonic()
-
-        if processed_img.mode != 'RGB':
-            processed_img = processed_img.convert('RGB')
+            planes = self._get_scratch_planes(*arr.shape[:2])
+            np.copyto(planes, arr.transpose(2, 0, 1))
+        self._add_stage_ns('color_correction', processing_start_ns)
+
+        conversion_start_ns = time.perf_counter_ns()
+        height, width = planes.shape[1:]
+
+        # Дизеринг и упаковка RGB565 одним проходом, без промежуточных массивов
+        if out is not None:
+            _apply_dithering_numba(planes, out.view(np.uint16), _RGB565_SWAP_BYTES)
+            byte_data = memoryview(out)
+        else:
+            packed = np.empty(width * height, dtype=np.uint16)
+            _apply_dithering_numba(planes, packed, _RGB565_SWAP_BYTES)
+            byte_data = packed.tobytes()
         
-        pixels = np.array(processed_img, dtype=np.float32)
-        width, height = processed_img.size
-        
-        _apply_dithering_numba(pixels, width, height)
-        
-        pixels = np.clip(pixels, 0, 255).astype(np.uint8)
-        r, g, b = pixels[:, :, 0], pixels[:, :, 1], pixels[:, :, 2]
-        
-        rgb565_val = ((r >> 3).astype(np.uint16) << 11) | \
-                    ((g >> 2).astype(np.uint16) << 5)  | \
-                    (b >> 3).astype(np.uint16)
+        self._add_stage_ns('rgb565_conversion', conversion_start_ns)
+
+        return byte_data
 
-        byte_data = rgb565_val.astype('>H').tobytes()
-        
-        self.metrics['frame_processing_time'].labels(stage='rgb565_conversion', pipeline_name=self.name).observe(time.monotonic() - conversion_start_time)
 
+    def _dither_whole_frame(self, arr: np.ndarray) -> np.ndarray:
+        """
+        Дизеринг всего кадра за один вызов; возвращает uint16-массив H x W с RGB565 (big-endian в памяти).
+        Ошибка распространяется через границы прямоугольников, как при дизеринге полного изображения,
+        а цветокоррекция и дизеринг не повторяются для каждого чанка.
+        """
+        height, width = arr.shape[:2]
+        if self._dithered_frame_buffer.size != width * height * 2:
+            self._dithered_frame_buffer = np.empty(width * height * 2, dtype=np.uint8)
+        self._apply_dithering_to_rgb565_bytes(arr, self._dithered_frame_buffer)
+        return self._dithered_frame_buffer.view(np.uint16).reshape(height, width)
+
+    def _encode_rect(self, curr_arr: np.ndarray, dithered_frame: np.ndarray | None, x, y, w, h, out: np.ndarray):
+        """
+        RGB565 прямоугольника в out (uint8-срез кадрового буфера, w*h*2); возвращает memoryview на out.
+        С дизерингом данные копируются из уже обработанного кадра, без него — упаковка по LUT только этого прямоугольника.
+        """
+        if dithered_frame is None:
+            return self._image_to_rgb565_bytes(curr_arr[y:y + h, x:x + w], out)
+        out.view(np.uint16).reshape(h, w)[...] = dithered_frame[y:y + h, x:x + w]
+        return memoryview(out)
+
+    def _take_frame_out_slice(self, offset: int, size: int):
+        """
+        Выделяет следующий срез кадрового буфера RGB565; возвращает (срез, новое смещение).
+        Если буфер мал, создается больший: уже выданные срезы держат ссылку на старый и остаются валидными до отправки.
+        """
+        if offset + size > self._rgb565_frame_buffer.size:
+            self._rgb565_frame_buffer = np.empty(max(offset + size, self._rgb565_frame_buffer.size * 2), dtype=np.uint8)
+            offset = 0
+        return self._rgb565_frame_buffer[offset:offset + size], offset + size
+
+    def _image_to_rgb565_bytes(self, img, out: np.ndarray | None = None):
+        """
+        Конвертирует PIL Image или uint8-массив в байты RGB565 без дизеринга; гамма, баланс белого и упаковка
+        выполняются одним проходом по LUT. out — как в _apply_dithering_to_rgb565_bytes (memoryview без копии).
+        """
+        conversion_start_ns = time.perf_counter_ns()
+        arr = self._as_rgb_array(img)
+        height, width = arr.shape[:2]
+
+        # Таблицы уже дают big-endian порядок байт в памяти, отдельный byteswap не нужен
+        lut_r, lut_g, lut_b = self._rgb565_luts
+        if out is not None:
+            _pack_rgb565_lut_numba(arr, lut_r, lut_g, lut_b, out.view(np.uint16))
+            byte_data = memoryview(out)
+        else:
+            packed = np.empty(width * height, dtype=np.uint16)
+            _pack_rgb565_lut_numba(arr, lut_r, lut_g, lut_b, packed)
+            byte_data = packed.tobytes()
+        self._add_stage_ns('rgb565_conversion', conversion_start_ns)
         return byte_data
 
+    def _find_dirty_rects(self, arr_prev: np.ndarray | None, arr_curr: np.ndarray):
+        """Находит измененные прямоугольники между двумя кадрами (uint8-массивы H x W x 3)."""
+        diff_start_ns = time.perf_counter_ns()
+        height, width = arr_curr.shape[:2]
 
-    def _image_to_rgb565_bytes(self, img: Image.Image) -> bytes:
-        """Конвертирует PIL Image в байты RGB565 после применения коррекций."""
-        processing_start_time = time.monotonic()
-        try:
-            processed_img = self._apply_gamma_and_white_balance(img)
-        except Exception as e:
-            self._log(f"Ошибка при применении гаммы/ББ: {e}. Используется исходное изображение.", "WARN")
-            processed_img = img.convert('RGB') if img.mode != 'RGB' else img
-        self.metrics['frame_processing_time'].labels(stage='color_correction', pipeline_name=self.name).observe(time.monotonic() - processing_start_time)
-
-        conversion_start_time = time.monotonic()
-        # Убедимся, что processed_img это RGB перед загрузкой пикселей
-        if processed_img.mode != 'RGB':
-            processed_img = processed_img.convert('RGB')
-            
-        pixels = processed_img.load()
-        width, height = processed_img.size
-        byte_data = bytearray(width * height * 2)
-        idx = 0
-        for y_coord in range(height):
-            for x_coord in range(width):
-                try:
-                    pixel_val = pixels[x_coord, y_coord]
-                    if isinstance(pixel_val, int): # для 'L' или 'P' мода после неудачной конвертации
-                         r, g, b = pixel_val, pixel_val, pixel_val
-                    else:
-                         r, g, b = pixel_val[:3] # Берем первые 3 компоненты, если есть альфа
-                except (TypeError, IndexError) as e:
-                    self._log(f"Некорректный пиксель ({pixels[x_coord, y_coord]}, mode: {processed_img.mode}) при конвертации в RGB565: {e}. Пропуск кадра.", "ERROR")
-                    return b'' 
-                rgb565_val = rgb_to_rgb565(r, g, b)
-                struct.pack_into('!H', byte_data, idx, rgb565_val)
-                idx += 2
-        self.metrics['frame_processing_time'].labels(stage='rgb565_conversion', pipeline_name=self.name).observe(time.monotonic() - conversion_start_time)
-        return bytes(byte_data)
-
-    def _find_dirty_rects(self, img_prev: Image.Image | None, img_curr: Image.Image):
-        """Находит измененные прямоугольники между двумя изображениями."""
-        diff_start_time = time.monotonic()
-        
-        current_img_rgb = img_curr.convert('RGB') if img_curr.mode != 'RGB' else img_curr
+        if arr_prev is None or arr_prev.shape != arr_curr.shape:
+            if arr_prev is not None:
+                self._log(f"Расхождение в размерах массивов при поиске dirty_rects: prev{arr_prev.shape}, curr{arr_curr.shape}. Отправка полного кадра.", "WARN")
+            self._add_stage_ns('diff_calculation', diff_start_ns)
+            yield (0, 0, width, height)
+            return
 
-        if img_prev is None or img_prev.size != current_img_rgb.size:
-            self.metrics['frame_processing_time'].labels(stage='diff_calculation', pipeline_name=self.name).observe(time.monotonic() - diff_start_time)
-            yield (0, 0, current_img_rgb.width, current_img_rgb.height)
+        if arr_prev is arr_curr:
+            self._add_stage_ns('diff_calculation', diff_start_ns)
             return
 
-        img_prev_rgb = img_prev.convert('RGB') if img_prev.mode != 'RGB' else img_prev
+        tile_size = self.config.get('dirty_tile_size', 16)
+        use_tiles = bool(tile_size and tile_size > 0)
+        if not use_tiles:
+            tile_size = max(height, width) # Одна "плитка" на весь кадр: нужен только bbox
+        tile_mask = np.zeros((-(-height // tile_size), -(-width // tile_size)), dtype=np.bool_)
+        row_mask = np.zeros(height, dtype=np.bool_)
+        # Разность, порог, маски тайлов и строк и bbox — одним проходом numba по uint8-кадрам
+        min_x, max_x = _tile_diff_numba(arr_prev, arr_curr, tile_size, int(self._current_dynamic_threshold), tile_mask, row_mask)
+
+        if max_x >= 0:
+            # Границы по Y — первая и последняя измененная строка: argmax по проекции с обоих концов
+            min_y = int(np.argmax(row_mask))
+            max_y = height - 1 - int(np.argmax(row_mask[::-1]))
+            yield from self._prune_unchanged_rows(self._select_dirty_rects(tile_mask, tile_size, use_tiles, width, height, min_x, min_y, max_x, max_y), row_mask)
         
-        arr_prev = np.array(img_prev_rgb, dtype=np.int16)
-        arr_curr = np.array(current_img_rgb, dtype=np.int16)
+        self._add_stage_ns('diff_calculation', diff_start_ns)
 
-        if arr_prev.shape != arr_curr.shape:
-            self._log(f"Расхождение в размерах массивов при поиске dirty_rects: prev{arr_prev.shape}, curr{arr_curr.shape}. Отправка полного кадра.", "WARN")
-            self.metrics['frame_processing_time'].labels(stage='diff_calculation', pipeline_name=self.name).observe(time.monotonic() - diff_start_time)
-            yield (0, 0, current_img_rgb.width, current_img_rgb.height)
+    def _prune_unchanged_rows(self, rects, row_mask):
+        """Вырезает из прямоугольников строки без изменений (config['dirty_row_split_min_gap']; 0 — не резать)."""
+        min_gap = self.config.get('dirty_row_split_min_gap', 4)
+        if not min_gap or min_gap <= 0:
+            yield from rects
             return
-
-        abs_diff_arr = np.sum(np.abs(arr_curr - arr_prev), axis=2)
-        changed_pixels_mask = abs_diff_arr > self._current_dynamic_threshold
-        
-        changed_y_coords, changed_x_coords = np.where(changed_pixels_mask)
-
-        if changed_y_coords.size > 0:
-            min_x = int(np.min(changed_x_coords))
-            max_x = int(np.max(changed_x_coords))
-            min_y = int(np.min(changed_y_coords))
-            max_y = int(np.max(changed_y_coords))
-            rect_w = max_x - min_x + 1
-            rect_h = max_y - min_y + 1
+        for rect in rects:
+            yield from _split_rect_by_rows(rect, row_mask, min_gap)
+
+    def _select_dirty_rects(self, tile_mask, tile_size, use_tiles, width, height, min_x, min_y, max_x, max_y):
+        """Прямоугольники из маски тайлов или один bbox, если тайлы покрывают почти весь bbox."""
+        rect_w = max_x - min_x + 1
+        rect_h = max_y - min_y + 1
+
+        if use_tiles:
+            tile_rects = []
+            dirty_area = 0
+            for tx0, ty0, tx1, ty1 in _merge_tile_runs(tile_mask):
+                x0, y0 = tx0 * tile_size, ty0 * tile_size
+                w, h = min(width, tx1 * tile_size) - x0, min(height, ty1 * tile_size) - y0
+                tile_rects.append((x0, y0, w, h))
+                dirty_area += w * h
+            # Если тайлы покрывают почти весь bbox, выгоднее один прямоугольник (меньше заголовков и send)
+            if dirty_area < self.config.get('dirty_full_refresh_ratio', 0.75) * rect_w * rect_h:
+                yield from tile_rects
+            else:
+                yield (min_x, min_y, rect_w, rect_h)
+        else:
             yield (min_x, min_y, rect_w, rect_h)
-        
-        self.metrics['frame_processing_time'].labels(stage='diff_calculation', pipeline_name=self.name).observe(time.monotonic() - diff_start_time)
 
-    def _pack_update_packet(self, x, y, w, h, data: bytes) -> bytes:
-        """Упаковывает данные обновления в пакет с заголовком."""
-        pack_start_time = time.monotonic()
+    def _pack_update_packet(self, x, y, w, h, data: bytes, sparse: bool = False) -> tuple[bytes, bytes]:
+        """
+        Упаковывает данные обновления в пакет с заголовком.
+        Возвращает (header, data) без склейки: пакеты кадра отправляются scatter-gather через _send_buffers.
+        sparse=True помечает данные как разреженную дельту (SPARSE_DELTA_FLAG в поле длины).
+        Порядок байт на проводе — big-endian и для заголовка, и для пикселей RGB565: ESP32 передает буфер
+        в pushImage без перестановки (setSwapBytes не включен), а дисплей ждет старший байт первым.
+        Кодировщики формируют его без отдельного прохода: перестановка делается в регистре (_pack_rgb565_planes_numba)
+        или заранее зашита в LUT (_build_color_luts).
+        """
+        pack_start_ns = time.perf_counter_ns()
         data_len = len(data)
-        header = struct.pack('!HHHH I', x, y, w, h, data_len)
-        packet = header + data
-        self.metrics['frame_processing_time'].labels(stage='packet_packing', pipeline_name=self.name).observe(time.monotonic() - pack_start_time)
-        self.metrics['packet_size_bytes'].labels(pipeline_name=self.name).observe(len(packet))
-        return packet
+        header = UPDATE_HEADER.pack(x, y, w, h, data_len | SPARSE_DELTA_FLAG if sparse else data_len)
+        self._add_stage_ns('packet_packing', pack_start_ns)
+        self._bound_metrics['packet_size_bytes'].observe(len(header) + data_len)
+        return header, data
+
+    def _pack_chunk_packet(self, curr_arr: np.ndarray, x, y, w, h, packed: np.ndarray, data) -> tuple:
+        """
+        Пакет для прямоугольника: если относительно предыдущего кадра изменилась малая доля пикселей,
+        отправляются только они (индекс + цвет, 4 байта на пиксель), иначе — весь прямоугольник.
+        packed — uint8-буфер RGB565 этого прямоугольника. Возвращает () если в прямоугольнике ничего не изменилось.
+        """
+        prev = self._prev_processed_array
+        max_ratio = self.config.get('sparse_delta_max_ratio', 0) # По умолчанию выключено: формат требует новой прошивки
+        if max_ratio and prev is not None and prev.shape == curr_arr.shape and w * h <= 0x10000:
+            changed = np.flatnonzero((curr_arr[y:y + h, x:x + w] != prev[y:y + h, x:x + w]).any(axis=2))
+            # Дельта выгодна, только пока она меньше полного прямоугольника (2 байта на пиксель)
+            if changed.size <= max_ratio * w * h and changed.size * 2 < w * h:
+                if changed.size == 0:
+                    return ()
+                payload = np.empty((changed.size, 4), dtype=np.uint8)
+                payload[:, :2] = changed.astype('>u2').view(np.uint8).reshape(-1, 2)
+                payload[:, 2:] = packed.reshape(-1, 2)[changed]
+                return self._pack_update_packet(x, y, w, h, payload.reshape(-1), sparse=True)
+        return self._pack_update_packet(x, y, w, h, data)
+
+    @staticmethod
+    def _send_buffers(conn: socket.socket, buffers: list):
+        """
+        Отправляет список буферов как один поток байт с минимумом системных вызовов.
+        sendmsg (POSIX) передает их scatter-gather без склейки; на Windows, где sendmsg нет, — один sendall.
+        Сначала пробуется os.writev прямо в дескриптор: у сокета с таймаутом Python перед каждым sendmsg
+        делает poll(), а writev в неблокирующий дескриптор — один системный вызов, пока в буфере ядра есть место.
+        """
+        if not hasattr(conn, 'sendmsg'):
+            conn.sendall(b''.join(buffers))
+            return
+        pending = [view for view in (memoryview(buf).cast('B') for buf in buffers) if view.nbytes]
+        fd = conn.fileno() if hasattr(os, 'writev') else -1
+        first = 0 # Индекс первого неотправленного буфера: без pop(0), который сдвигает весь список
+        while first < len(pending):
+            window = pending[first:first + SENDMSG_MAX_BUFFERS]
+            sent = None
+            if fd >= 0:
+                try:
+                    sent = os.writev(fd, window)
+                except BlockingIOError:
+                    pass # Буфер ядра полон: ждем его через sendmsg с таймаутом сокета
+            if sent is None:
+                sent = conn.sendmsg(window)
+            # sendmsg может отправить не все: пропускаем полностью отправленные буферы и подрезаем частичный
+            while sent > 0 and first < len(pending):
+                if sent >= pending[first].nbytes:
+                    sent -= pending[first].nbytes
+                    first += 1
+                else:
+                    pending[first] = pending[first][sent:]
+                    sent = 0
+
+    def _pin_current_thread(self, config_key: str):
+        """
+        Привязывает вызывающий поток к CPU из config[config_key] (None — без привязки).
+        Кадр и его буферы тогда остаются в кэшах одного ядра, а не мигрируют вслед за потоком.
+        os.sched_setaffinity с pid 0 действует на текущий поток; есть только в Linux.
+        """
+        cpu = self.config.get(config_key)
+        if cpu is None:
+            return
+        if not hasattr(os, 'sched_setaffinity'):
+            self._log(f"{config_key}={cpu}: привязка потоков к CPU не поддерживается на этой платформе.", "WARN")
+            return
+        try:
+            os.sched_setaffinity(0, {int(cpu)})
+            self._log(f"Поток {threading.current_thread().name} привязан к CPU {cpu}.")
+        except (OSError, ValueError, TypeError) as e:
+            self._log(f"Не удалось привязать поток к CPU {cpu} ({config_key}): {e}", "WARN")
 
     def _generator_loop(self):
         self._log("Поток генератора запускается.")
+        self._pin_current_thread('generator_cpu')
         
         source_mode = self.config['image_source_mode']
         sct_instance_local = None # Локальный экземпляр mss для этого потока
@@ -336,16 +756,25 @@ class StreamPipeline:
 
         target_interval = self.config.get('generator_target_interval_sec', 0.05)
         low_water_mark = self.config.get('generator_low_water_mark', 2)
+        # Параметры ресэмплинга неизменны в течение сессии: читаем их один раз, а не на каждом кадре.
+        # Коэффициенты LANCZOS Pillow считает в C за один проход по строкам/столбцам (O(W+H)), это мало
+        # по сравнению с самой сверткой; плотные матрицы весов в NumPy были бы медленнее.
+        target_size = (self.config['target_width'], self.config['target_height'])
+        resize_reducing_gap = self.config.get('resize_reducing_gap', 2.0)
+        resize_filter = self._resolve_resize_filter()
+        # Дочерние метрики стадий генератора фиксированы на всю сессию: берем их до цикла
+        generate_metric = self._stage_metric(f"generate_{source_mode.lower()}")
+        resize_metric = self._stage_metric('resize_thread')
+        canvas = None # Холст генератора на всю сессию, см. ветку отрисовки ниже
 
         while not self.pipeline_internal_stop_event.is_set() and not self.global_server_stop_event.is_set():
             loop_start_time = time.monotonic()
             q_size = self.frames_queue.qsize()
-            self.metrics['frames_queue_size'].labels(pipeline_name=self.name).observe(q_size)
+            self._bound_metrics['frames_queue_size'].observe(q_size)
 
             if q_size < low_water_mark:
-                gen_start_time = time.monotonic()
-                generated_image: Image.Image | None = None
-                metric_stage_label = f"generate_{source_mode.lower()}"
+                gen_start_ns = time.perf_counter_ns()
+                generated_image: Image.Image | np.ndarray | None = None
                 canvas_resolution = (self.config['target_width'], self.config['target_height'])
 
                 try:
@@ -353,7 +782,13 @@ class StreamPipeline:
                         if sct_instance_local:
                             capture_region = self.config['capture_region']
                             sct_img = sct_instance_local.grab(capture_region)
-                            generated_image = Image.frombytes('RGB', (sct_img.width, sct_img.height), sct_img.rgb, 'raw', 'RGB')
+                            if (sct_img.width, sct_img.height) == target_size:
+                                # Ресэмплинг не нужен: кадр сразу становится RGB-представлением буфера BGRA без копий и PIL
+                                generated_image = self._bgra_buffer_to_rgb_array(sct_img.raw, sct_img.width, sct_img.height)
+                            else:
+                                # Сырой буфер BGRA от mss декодируется в RGB одним проходом в C ('BGRX'),
+                                # без промежуточного преобразования sct_img.rgb и лишней копии кадра
+                                generated_image = Image.frombuffer('RGB', (sct_img.width, sct_img.height), sct_img.raw, 'raw', 'BGRX', 0, 1)
                         else:
                             self._log("Экземпляр MSS (sct) не доступен в генераторе SCREEN_CAPTURE!", "ERROR")
                             self.pipeline_internal_stop_event.set(); break 
@@ -364,21 +799,33 @@ class StreamPipeline:
                         if self._generator_instance.resolution != canvas_resolution and source_mode != "PROMETHEUS_MONITOR": # Prometheus может иметь свою логику разрешения
                              self._log(f"Разрешение генератора ({source_mode}) {self._generator_instance.resolution} не совпадает с целевым холстом {canvas_resolution}!", "WARN")
                         
-                        bg_color_tuple = (0,0,0) # Default background
-                        if hasattr(self._generator_instance, '_colors') and isinstance(self._generator_instance._colors, dict):
-                            bg_color_conf = self._generator_instance._colors.get("background")
-                            if isinstance(bg_color_conf, (list, tuple)) and len(bg_color_conf) == 3:
-                                bg_color_tuple = tuple(bg_color_conf)
-
-                        canvas = Image.new('RGB', self._generator_instance.resolution, color=bg_color_tuple)
+                        # Холст переиспользуется между кадрами: в очередь уходит копия (np.asarray ниже), а генераторы
+                        # перерисовывают его целиком. Это убирает выделение и заливку W*H*4 байт на кадр и позволяет
+                        # GraphicsEngine пропускать отрисовку, когда тот же холст приходит без новых данных
+                        if canvas is None or canvas.size != self._generator_instance.resolution:
+                            bg_color_tuple = (0,0,0) # Default background
+                            if hasattr(self._generator_instance, '_colors') and isinstance(self._generator_instance._colors, dict):
+                                bg_color_conf = self._generator_instance._colors.get("background")
+                                if isinstance(bg_color_conf, (list, tuple)) and len(bg_color_conf) == 3:
+                                    bg_color_tuple = tuple(bg_color_conf)
+                            canvas = Image.new('RGB', self._generator_instance.resolution, color=bg_color_tuple)
 
                         if hasattr(self._generator_instance, 'draw_frame'):
-                            self._generator_instance.draw_frame(canvas)
+                            draw_method = self._generator_instance.draw_frame
                         elif hasattr(self._generator_instance, 'generate_image_frame'):
-                            self._generator_instance.generate_image_frame(canvas)
+                            draw_method = self._generator_instance.generate_image_frame
                         else:
                             self._log(f"У генератора {type(self._generator_instance)} нет ожидаемого метода отрисовки.", "ERROR")
                             self.pipeline_internal_stop_event.set(); break
+                        try:
+                            drawn = draw_method(canvas)
+                        except Exception:
+                            canvas = None # Холст мог быть дорисован частично: следующий кадр начнется с чистого фона
+                            raise
+                        if drawn is None:
+                            # Генератор сообщил об ошибке без исключения (например, не удался скриншот окна):
+                            # отправляется чистый фон, как раньше, а не пиксели прошлого кадра
+                            canvas.paste(bg_color_tuple, (0, 0, *canvas.size))
                         generated_image = canvas
                     else:
                         self._log(f"Генератор для режима '{source_mode}' не инициализирован или недоступен.", "WARN")
@@ -388,10 +835,33 @@ class StreamPipeline:
                         except: pass 
                         time.sleep(0.5)
 
-                    if generated_image:
-                        self.metrics['frame_processing_time'].labels(stage=metric_stage_label, pipeline_name=self.name).observe(time.monotonic() - gen_start_time)
-                        self.frames_queue.put(generated_image, timeout=0.1)
-                        self.metrics['frames_generated_total'].labels(pipeline_name=self.name).inc()
+                    if generated_image is not None:
+                        generate_metric.observe((time.perf_counter_ns() - gen_start_ns) * 1e-9)
+
+                        # Ресэмплинг и перевод в массив выполняются здесь, параллельно с кодированием
+                        # и отправкой предыдущего кадра в потоке потребителя
+                        resize_start_ns = time.perf_counter_ns()
+                        if isinstance(generated_image, np.ndarray):
+                            frame_array = generated_image # Уже RGB-массив целевого размера
+                        else:
+                            if generated_image.size != target_size:
+                                # reducing_gap: сначала быстрое целочисленное усреднение (reduce, аналог INTER_AREA),
+                                # затем фильтр (по умолчанию LANCZOS) только на последнем шаге с небольшим коэффициентом
+                                generated_image = generated_image.resize(
+                                    target_size,
+                                    resize_filter,
+                                    reducing_gap=resize_reducing_gap
+                                )
+                            if generated_image.mode != 'RGB':
+                                generated_image = generated_image.convert('RGB')
+                            frame_array = np.asarray(generated_image)
+                        resize_metric.observe((time.perf_counter_ns() - resize_start_ns) * 1e-9)
+
+                        # Незабранный кадр замещается под той же блокировкой, что и запись: отдельной выборки
+                        # и task_done на каждый кадр нет, а потери видны в счетчике
+                        if self.frames_queue.put(frame_array):
+                            self._bound_metrics['frames_dropped_total'].inc()
+                        self._bound_metrics['frames_generated_total'].inc()
 
                 except mss.exception.ScreenShotError as e:
                     self._log(f"Ошибка захвата экрана: {e}. Попытка переинициализации mss...", "WARN")
@@ -407,12 +877,8 @@ class StreamPipeline:
                         self.pipeline_internal_stop_event.set(); break
                     time.sleep(1.0) # Пауза после переинициализации
                     continue
-                except queue.Full:
-                    pass 
                 except Exception as e:
-                    self._log(f"Ошибка в цикле генератора (режим: {source_mode}): {e}", "ERROR")
-                    import traceback
-                    traceback.print_exc()
+                    self._log_exception(f"Ошибка в цикле генератора (режим: {source_mode}): {e}")
                     time.sleep(0.1)
 
                 elapsed_this_loop = time.monotonic() - loop_start_time
@@ -433,15 +899,33 @@ class StreamPipeline:
 
         self._log("Поток генератора остановлен.")
 
+    def _resolve_resize_filter(self):
+        """
+        Фильтр ресэмплинга из config['resize_filter'] (имя из Image.Resampling: LANCZOS, BICUBIC, BILINEAR, BOX...).
+        LANCZOS — лучшее качество; BILINEAR/BOX заметно быстрее. Сборка Pillow-SIMD ускоряет любой из них без изменений кода.
+        """
+        filter_name = str(self.config.get('resize_filter', 'LANCZOS')).upper()
+        resize_filter = getattr(Image.Resampling, filter_name, None)
+        if resize_filter is None:
+            self._log(f"Неизвестный resize_filter: {filter_name}. Используется LANCZOS.", "WARN")
+            resize_filter = Image.Resampling.LANCZOS
+        return resize_filter
+
+    @staticmethod
+    def _bgra_buffer_to_rgb_array(raw, width: int, height: int) -> np.ndarray:
+        """Представление буфера BGRA (mss) как uint8-массива H x W x 3 в порядке RGB: срез каналов в обратном порядке, без копии."""
+        return np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 4)[..., 2::-1]
+
     def _consumer_loop(self):
         """Цикл потока обработки и отправки кадров клиенту."""
         self._log("Поток потребителя запускается.")
-        self._prev_processed_image = None
+        self._prev_processed_array = None
         self._current_dynamic_threshold = self.config.get('min_dirty_rect_threshold', 10)
         self._frame_processing_times_history.clear()
+        self._frame_stage_ns.clear()
 
-        self.metrics['current_dynamic_threshold'].labels(pipeline_name=self.name).set(self._current_dynamic_threshold)
-        self.metrics['consumer_calculated_fps'].labels(pipeline_name=self.name).set(0)
+        self._bound_metrics['current_dynamic_threshold'].set(self._current_dynamic_threshold)
+        self._bound_metrics['consumer_calculated_fps'].set(0)
 
         target_fps_val = self.config.get('target_fps', 15.0)
         history_size = self.config.get('fps_history_size', 10)
@@ -451,27 +935,26 @@ class StreamPipeline:
         step_up = self.config.get('threshold_adjustment_step_up', 10)
         step_down = self.config.get('threshold_adjustment_step_down', 5)
         max_chunk_data = self.config.get('max_chunk_data_size', 8192)
+        dithering_enabled = self.config.get('dithering', True)
+        queue_size_metric = self._bound_metrics['frames_queue_size']
+        full_loop_metric = self._stage_metric('full_consumer_loop_thread')
 
         while not self.pipeline_internal_stop_event.is_set() and not self.global_server_stop_event.is_set():
             try:
                 raw_frame = self.frames_queue.get(timeout=0.1)
                 q_size = self.frames_queue.qsize()
-                self.metrics['frames_queue_size'].labels(pipeline_name=self.name).observe(q_size)
+                queue_size_metric.observe(q_size)
 
                 loop_processing_start_time = time.monotonic()
 
-                if not isinstance(raw_frame, Image.Image):
+                if not isinstance(raw_frame, np.ndarray):
                     self._log(f"Получен неверный тип кадра: {type(raw_frame)}. Пропуск.", "WARN")
-                    self.frames_queue.task_done(); continue
+                    continue
                 
-                resize_start_time = time.monotonic()
-                img_resized = raw_frame.resize(
-                    (self.config['target_width'], self.config['target_height']),
-                    Image.Resampling.LANCZOS
-                )
-                self.metrics['frame_processing_time'].labels(stage='resize_thread', pipeline_name=self.name).observe(time.monotonic() - resize_start_time)
-
-                dirty_rects_list = list(self._find_dirty_rects(self._prev_processed_image, img_resized))
+                # Кадр уже приведен к целевому размеру и переведен в массив в потоке генератора;
+                # он же сохраняется как предыдущий для следующего сравнения
+                curr_arr = raw_frame
+                dirty_rects_list = list(self._find_dirty_rects(self._prev_processed_array, curr_arr))
 
                 socket_error_this_frame = False
                 chunks_sent_this_frame = 0
@@ -479,6 +962,9 @@ class StreamPipeline:
 
                 if dirty_rects_list:
                     send_duration_this_frame_start = time.monotonic()
+                    frame_buffers = [] # Заголовки и данные всех чанков кадра: отправляются одним вызовом
+                    frame_out_offset = 0 # Позиция следующего чанка в self._rgb565_frame_buffer
+                    dithered_frame = self._dither_whole_frame(curr_arr) if dithering_enabled else None
                     for x, y, w, h in dirty_rects_list:
                         full_rect_data_size = w * h * 2
                         if full_rect_data_size > max_chunk_data:
@@ -490,45 +976,42 @@ class StreamPipeline:
                                 actual_chunk_h = min(chunk_h, h - current_y_offset)
                                 if actual_chunk_h <= 0: continue
 
-                                chunk_img_to_send = img_resized.crop((x, y + current_y_offset, x + w, y + current_y_offset + actual_chunk_h))
-                                chunk_data_bytes = self._apply_dithering_to_rgb565_bytes(chunk_img_to_send)
+                                chunk_out, frame_out_offset = self._take_frame_out_slice(frame_out_offset, w * actual_chunk_h * 2)
+                                chunk_data_bytes = self._encode_rect(curr_arr, dithered_frame, x, y + current_y_offset, w, actual_chunk_h, chunk_out)
                                 if not chunk_data_bytes: continue
 
-                                packet_to_send = self._pack_update_packet(x, y + current_y_offset, w, actual_chunk_h, chunk_data_bytes)
-                                
-                                try:
-                                    if not self.client_connection: raise socket.error("Client connection is None")
-                                    self.client_connection.sendall(packet_to_send)
-                                    chunks_sent_this_frame +=1
-                                except socket.error as e:
-                                    self._log(f"Ошибка сокета при отправке чанка: {e}", "WARN")
-                                    self.metrics['connection_errors_total'].labels(pipeline_name=self.name).inc()
-                                    socket_error_this_frame = True; break 
-                            if socket_error_this_frame: break
+                                packet = self._pack_chunk_packet(curr_arr, x, y + current_y_offset, w, actual_chunk_h, chunk_out, chunk_data_bytes)
+                                if not packet: continue
+                                frame_buffers.extend(packet)
+                                chunks_sent_this_frame += 1
                         else: 
-                            region_img_to_send = img_resized.crop((x,y, x+w, y+h))
-                            region_data_bytes = self._apply_dithering_to_rgb565_bytes(region_img_to_send)
+                            region_out, frame_out_offset = self._take_frame_out_slice(frame_out_offset, w * h * 2)
+                            region_data_bytes = self._encode_rect(curr_arr, dithered_frame, x, y, w, h, region_out)
                             if not region_data_bytes: continue
 
-                            packet_to_send = self._pack_update_packet(x,y,w,h,region_data_bytes)
-                            try:
-                                if not self.client_connection: raise socket.error("Client connection is None")
-                                self.client_connection.sendall(packet_to_send)
-                                chunks_sent_this_frame += 1
-                            except socket.error as e:
-                                self._log(f"Ошибка сокета при отправке региона: {e}", "WARN")
-                                self.metrics['connection_errors_total'].labels(pipeline_name=self.name).inc()
-                                socket_error_this_frame = True; break
+                            packet = self._pack_chunk_packet(curr_arr, x, y, w, h, region_out, region_data_bytes)
+                            if not packet: continue
+                            frame_buffers.extend(packet)
+                            chunks_sent_this_frame += 1
+
+                    if frame_buffers:
+                        try:
+                            if not self.client_connection: raise socket.error("Client connection is None")
+                            self._send_buffers(self.client_connection, frame_buffers)
+                        except socket.error as e:
+                            self._log(f"Ошибка сокета при отправке данных кадра: {e}", "WARN")
+                            self._bound_metrics['connection_errors_total'].inc()
+                            socket_error_this_frame = True
                     
                     if socket_error_this_frame:
                         raise socket.error("Ошибка сокета при отправке данных кадра") 
 
-                    self.metrics['chunks_per_frame'].labels(pipeline_name=self.name).observe(chunks_sent_this_frame)
+                    self._bound_metrics['chunks_per_frame'].observe(chunks_sent_this_frame)
                     if send_duration_this_frame_start > 0 :
-                        self.metrics['dirty_rects_send_duration_seconds'].labels(pipeline_name=self.name).observe(time.monotonic() - send_duration_this_frame_start)
+                        self._bound_metrics['dirty_rects_send_duration_seconds'].observe(time.monotonic() - send_duration_this_frame_start)
 
-                self._prev_processed_image = img_resized
-                self.metrics['frames_processed_total'].labels(pipeline_name=self.name).inc()
+                self._prev_processed_array = curr_arr
+                self._bound_metrics['frames_processed_total'].inc()
 
                 frame_total_processing_time = time.monotonic() - loop_processing_start_time
                 self._frame_processing_times_history.append(frame_total_processing_time)
@@ -536,7 +1019,7 @@ class StreamPipeline:
                 if len(self._frame_processing_times_history) >= history_size and history_size > 0:
                     avg_time = sum(self._frame_processing_times_history) / len(self._frame_processing_times_history)
                     current_fps = 1.0 / avg_time if avg_time > 0 else 0.0
-                    self.metrics['consumer_calculated_fps'].labels(pipeline_name=self.name).set(current_fps)
+                    self._bound_metrics['consumer_calculated_fps'].set(current_fps)
 
                     hysteresis = target_fps_val * hyst_factor
                     old_thresh = self._current_dynamic_threshold
@@ -547,26 +1030,32 @@ class StreamPipeline:
                          self._current_dynamic_threshold = max(min_thresh, self._current_dynamic_threshold - step_down)
                     
                     if old_thresh != self._current_dynamic_threshold:
-                        self.metrics['current_dynamic_threshold'].labels(pipeline_name=self.name).set(self._current_dynamic_threshold)
+                        self._bound_metrics['current_dynamic_threshold'].set(self._current_dynamic_threshold)
                 
-                self.metrics['frame_processing_time'].labels(stage='full_consumer_loop_thread', pipeline_name=self.name).observe(frame_total_processing_time)
-                self.frames_queue.task_done()
+                self._flush_stage_times()
+                full_loop_metric.observe(frame_total_processing_time)
 
             except queue.Empty:
                 continue 
             except socket.error as e: 
                 self._log(f"Ошибка сокета в цикле потребителя: {e}. Остановка потребителя для текущей сессии.", "WARN")
-                self.metrics['consumer_calculated_fps'].labels(pipeline_name=self.name).set(0)
+                self._bound_metrics['consumer_calculated_fps'].set(0)
                 break 
             except Exception as e:
-                self._log(f"Неожиданная ошибка в цикле потребителя: {e}", "ERROR")
-                import traceback
-                traceback.print_exc()
-                self.metrics['consumer_calculated_fps'].labels(pipeline_name=self.name).set(0)
+                self._log_exception(f"Неожиданная ошибка в цикле потребителя: {e}")
+                self._bound_metrics['consumer_calculated_fps'].set(0)
                 break
 
         self._log("Поток потребителя остановлен.")
 
+    def _run_consumer(self):
+        """Точка входа потока потребителя: по выходу из _consumer_loop (в т.ч. по исключению) будит менеджера."""
+        try:
+            self._pin_current_thread('consumer_cpu')
+            self._consumer_loop()
+        finally:
+            self._session_done_event.set()
+
     def _cleanup_active_session(self):
         """Останавливает внутренние потоки и закрывает клиентское соединение."""
         self._log("Очистка активной сессии клиента...")
@@ -607,11 +1096,9 @@ class StreamPipeline:
             except Exception as e: self._log(f"Ошибка при закрытии локального экземпляра sct: {e}", "WARN")
         self._sct_instance_local_to_generator_thread = None
         
-        self._log("Очистка очереди кадров...")
-        while not self.frames_queue.empty():
-            try: self.frames_queue.get_nowait(); self.frames_queue.task_done()
-            except queue.Empty: break
-        self._prev_processed_image = None # Сброс для следующей сессии
+        self._log("Очистка слота кадров...")
+        self.frames_queue.clear()
+        self._prev_processed_array = None # Сброс для следующей сессии
         self._log("Активная сессия очищена.")
 
     def start_pipeline_manager(self):
@@ -626,14 +1113,46 @@ class StreamPipeline:
         if not self.pipeline_internal_stop_event.is_set(): # Сигнал для generator/consumer
             self.pipeline_internal_stop_event.set()
         # global_server_stop_event уже должен быть установлен извне для остановки _listening_loop
+        # Будим select() в _listening_loop или ожидание активной сессии; слушающий сокет закрывает сам менеджер
+        self._session_done_event.set()
+        self._wake_manager()
+
+    def _wake_manager(self):
+        """Будит _listening_loop, ожидающий в select()."""
+        writer = self._wakeup_writer
+        if writer is None: # Менеджер еще не начал ожидание или уже завершился
+            return
+        try:
+            writer.send(b'\0')
+        except OSError: # Канал уже полон (менеджер и так проснется) или закрыт после остановки
+            pass
+
+    def _drain_wakeup(self):
+        """Вычитывает байты пробуждения, чтобы следующий select() снова блокировался."""
+        try:
+            while self._wakeup_reader.recv(64):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _open_wakeup_channel(self):
+        """Создает канал пробуждения: socketpair, а не os.pipe — select на Windows работает только с сокетами."""
+        reader, writer = socket.socketpair()
+        reader.setblocking(False)
+        writer.setblocking(False)
+        self._wakeup_reader, self._wakeup_writer = reader, writer
+
+    def _close_wakeup_channel(self):
+        """Закрывает оба конца канала пробуждения, чтобы каждый запуск/остановка пайплайна не оставлял открытых сокетов."""
+        reader, writer = self._wakeup_reader, self._wakeup_writer
+        self._wakeup_reader = self._wakeup_writer = None
+        for sock in (reader, writer):
+            if sock is not None:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
 
-        if self.server_socket: # Закрываем слушающий сокет, чтобы прервать accept
-            try:
-                self.server_socket.close() 
-                self._log("Серверный (слушающий) сокет закрыт для прерывания accept.")
-            except Exception as e:
-                self._log(f"Ошибка при закрытии серверного сокета во время остановки: {e}", "WARN")
-        
     def join_manager_thread(self, timeout=None):
         """Ожидает завершения управляющего потока пайплайна (_listening_loop)."""
         if self.manager_thread and self.manager_thread.is_alive():
@@ -644,11 +1163,39 @@ class StreamPipeline:
             else:
                 self._log("Управляющий поток успешно завершен.")
 
+    def _configure_client_socket(self, conn: socket.socket):
+        """
+        Опции TCP принятого соединения: TCP_NODELAY всегда, размеры буферов и TCP_QUICKACK — из конфигурации.
+        Ошибка отдельной опции (неизвестна платформе, запрещена лимитами ядра) не мешает сессии.
+        """
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        options = (
+            # Больший буфер отправки: кадр целиком (до W*H*2 байт) уходит в ядро без ожидания ACK
+            ('SO_SNDBUF', socket.SOL_SOCKET, getattr(socket, 'SO_SNDBUF', None), self.config.get('socket_send_buffer_size', 262144)),
+            # ESP32 почти ничего не присылает, поэтому по умолчанию буфер приема системный
+            ('SO_RCVBUF', socket.SOL_SOCKET, getattr(socket, 'SO_RCVBUF', None), self.config.get('socket_receive_buffer_size', 0)),
+            # Только Linux; влияет лишь на подтверждение входящих данных, ядро может снова включить отложенный ACK
+            ('TCP_QUICKACK', socket.IPPROTO_TCP, getattr(socket, 'TCP_QUICKACK', None), int(bool(self.config.get('socket_quickack', False)))),
+        )
+        for option_name, level, option, value in options:
+            if not value:
+                continue
+            if option is None:
+                self._log(f"{option_name} не поддерживается на этой платформе, параметр пропущен.", "WARN")
+                continue
+            try:
+                conn.setsockopt(level, option, value)
+            except OSError as e:
+                self._log(f"Не удалось установить {option_name}={value}: {e}", "WARN")
+
     def _listening_loop(self):
         """Основной цикл менеджера пайплайна."""
+        warmup_start = time.perf_counter()
+        _warmup_numba_kernels() # До первого клиента, а не на его первом кадре
+        self._log(f"numba-ядра готовы за {time.perf_counter() - warmup_start:.2f} с.")
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.settimeout(1.0) 
+        self.server_socket.setblocking(False) # accept только после select(): клиент мог уже отключиться
 
         try:
             self.server_socket.bind(('', self.port))
@@ -659,16 +1206,50 @@ class StreamPipeline:
             if self.server_socket: self.server_socket.close() 
             return 
 
+        # Ожидание без таймаута: select() (epoll на Linux) просыпается по подключению или по сигналу остановки
+        self._open_wakeup_channel()
+        wakeup_reader = self._wakeup_reader
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(self.server_socket, selectors.EVENT_READ)
+            selector.register(wakeup_reader, selectors.EVENT_READ)
+            self._serve_clients(selector, wakeup_reader)
+        finally:
+            for fileobj in (self.server_socket, wakeup_reader):
+                try:
+                    selector.unregister(fileobj)
+                except (KeyError, ValueError):
+                    pass
+            selector.close()
+            self._close_wakeup_channel()
+
+        if self.server_socket:
+            try:
+                self.server_socket.close()
+                self._log("Серверный (слушающий) сокет успешно закрыт.")
+            except Exception as e_sock:
+                self._log(f"Ошибка при закрытии серверного (слушающего) сокета: {e_sock}", "WARN")
+        
+        self._log("Управляющий поток (менеджер пайплайна) полностью остановлен.")
+
+    def _serve_clients(self, selector, wakeup_reader):
+        """Принимает клиентов и обслуживает их сессии, пока не придет глобальная остановка."""
         while not self.global_server_stop_event.is_set():
             try:
+                ready = {key.fileobj for key, _ in selector.select()}
+                if wakeup_reader in ready:
+                    self._drain_wakeup()
+                    continue # Условие цикла проверит global_server_stop_event
                 self.client_connection, client_address = self.server_socket.accept()
-                self.client_connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.client_connection.setblocking(True) # Не наследуем неблокирующий режим слушающего сокета
+                self._configure_client_socket(self.client_connection)
                 self.client_connection.settimeout(self.config.get('socket_timeout', 2.0))
                 
                 self._log(f"Клиент {client_address} успешно подключен.")
-                self.metrics['reconnections_total'].labels(pipeline_name=self.name).inc()
+                self._bound_metrics['reconnections_total'].inc()
 
                 self.pipeline_internal_stop_event.clear()
+                self._session_done_event.clear()
 
                 if not self._initialize_generator_instance():
                     self._log("Не удалось инициализировать экземпляр генератора. Закрытие соединения.", "ERROR")
@@ -677,23 +1258,25 @@ class StreamPipeline:
                     continue
 
                 self._generator_thread = threading.Thread(target=self._generator_loop, daemon=True, name=f"{self.name}_Gen")
-                self._consumer_thread = threading.Thread(target=self._consumer_loop, daemon=True, name=f"{self.name}_Con")
+                self._consumer_thread = threading.Thread(target=self._run_consumer, daemon=True, name=f"{self.name}_Con")
 
                 self._generator_thread.start()
                 self._consumer_thread.start()
 
-                while self._consumer_thread.is_alive() and not self.global_server_stop_event.is_set():
-                    self._consumer_thread.join(timeout=0.2) 
+                # stop_pipeline_manager сначала ставит global_server_stop_event, затем событие сессии:
+                # если событие было сброшено выше уже после этого, проверка флага не даст зависнуть в wait()
+                if not self.global_server_stop_event.is_set():
+                    self._session_done_event.wait()
 
                 if self.global_server_stop_event.is_set():
                     self._log("Получен глобальный сигнал остановки сервера во время активной сессии клиента.")
-                elif not self._consumer_thread.is_alive(): 
+                else: # Событие ставится в finally потока, is_alive() в этот момент может быть еще True
                     self._log("Поток потребителя завершил работу.")
                 
                 self._cleanup_active_session()
 
-            except socket.timeout: 
-                continue 
+            except BlockingIOError: # Подключение пропало между select() и accept()
+                continue
             except OSError as e:
                 if self.global_server_stop_event.is_set(): # Ошибка из-за закрытия сокета при остановке
                     self._log(f"Ошибка сокета '{e}' при accept, вероятно, из-за остановки сервера.")
@@ -702,21 +1285,10 @@ class StreamPipeline:
                     self._log(f"Ошибка сокета '{e}' при accept. Пауза перед повторной попыткой...", "ERROR")
                     time.sleep(1) 
             except Exception as e:
-                self._log(f"Неожиданная ошибка в цикле прослушивания/подключения: {e}", "ERROR")
-                import traceback
-                traceback.print_exc()
+                self._log_exception(f"Неожиданная ошибка в цикле прослушивания/подключения: {e}")
                 if self.client_connection or self._consumer_thread or self._generator_thread:
                      self._cleanup_active_session()
                 time.sleep(1)
 
         self._log("Получен сигнал глобальной остановки или критическая ошибка. Завершение цикла прослушивания.")
-        self._cleanup_active_session() 
-        
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-                self._log("Серверный (слушающий) сокет успешно закрыт.")
-            except Exception as e_sock:
-                self._log(f"Ошибка при закрытии серверного (слушающего) сокета: {e_sock}", "WARN")
-        
-        self._log("Управляющий поток (менеджер пайплайна) полностью остановлен.")
\ No newline at end of file
+        self._cleanup_active_session() 
\ No newline at end of file
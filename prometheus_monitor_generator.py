@@ -3,10 +3,9 @@
 import time
 import threading
 import math
-from collections import deque
-from PIL import Image # Для создания начального холста
+from PIL import Image, ImageDraw # Image — начальный холст, ImageDraw — сообщение об ошибке
 # Импорт нового графического движка
-from graphics_engine import MonitorGraphicsEngine # Убедитесь, что graphics_engine.py доступен
+from graphics_engine import MonitorGraphicsEngine, HistoryBuffer, history_storage_for, cached_default_font # Убедитесь, что graphics_engine.py доступен
 # Клиент Prometheus все еще нужен здесь
 from prometheus_api_client import PrometheusConnect, PrometheusApiClientException
 from copy import deepcopy # Для глубокого копирования словарей и списков
@@ -161,12 +160,15 @@ class PrometheusMonitorGenerator:
              else:
                  sub_metrics = [key] # Для метрик с одним значением (gpu_load, cpu_load и т.д.)
 
+             # Тип хранения истории (int16 для процентов, float32 для остального) — один на метрику
+             hist_dtype, hist_scale = history_storage_for(self._metric_config[key])
              for sub_key in sub_metrics:
                  # Длина истории 1 для статичных значений (например, total RAM)
                  hist_len = 1 if 'total' in sub_key else self.history_length
                  default_val = 0.0 if 'total' not in sub_key else 0.0 # Или другое значение для total, если нужно
                  self.metric_data[sub_key] = {
-                     "history": deque([default_val] * hist_len, maxlen=hist_len),
+                     # Кольцевой буфер на NumPy вместо deque: график читает массив напрямую, без list()
+                     "history": HistoryBuffer(hist_len, dtype=hist_dtype, fill=default_val, scale=hist_scale),
                      "current": default_val
                  }
         # Если disk_usage не в _metric_config, disk_range_max не будет создан, это нормально,
@@ -334,9 +336,9 @@ class PrometheusMonitorGenerator:
              print("ОШИБКА: Графический движок не инициализирован в PrometheusMonitorGenerator.")
              # Можно нарисовать сообщение об ошибке на target_image
              try:
+                target_image.paste(tuple(self._colors.get('background', (0,0,0))), (0, 0, *target_image.size)) # Заливка через paste (memset), без ImageDraw
                 draw = ImageDraw.Draw(target_image)
-                draw.rectangle([0,0, *target_image.size], fill=self._colors.get('background', (0,0,0)))
-                error_font = ImageFont.load_default() # Простой шрифт
+                error_font = cached_default_font() # Встроенный шрифт PIL, загружается один раз
                 draw.text((10,10), "Error: Graphics Engine Failed", fill=self._colors.get('error', (255,0,0)), font=error_font)
              except Exception: pass # Если даже это не удалось
              return target_image
@@ -344,11 +346,11 @@ class PrometheusMonitorGenerator:
         # Получаем потокобезопасную копию текущих данных
         data_copy_for_frame = {}
         with self._lock:
-            # Глубокое копирование, если есть вложенные изменяемые структуры (особенно deques)
+            # Глубокое копирование, если есть вложенные изменяемые структуры (истории HistoryBuffer)
             for key, value_dict in self.metric_data.items():
                  if isinstance(value_dict, dict) and "history" in value_dict and "current" in value_dict:
                       data_copy_for_frame[key] = {
-                          "history": value_dict["history"].copy(), # Копируем deque
+                          "history": value_dict["history"].copy(), # Копируем буфер (один memcpy массива)
                           "current": value_dict["current"]         # Копируем текущее значение
                           }
                  else: # Для простых значений, как disk_range_max
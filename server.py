@@ -21,6 +21,13 @@ def start_prometheus_http_server(port, host='0.0.0.0'):
         print(f"[!] Не удалось запустить Prometheus exporter на порту {port}: {e}")
         print("[!] Метрики сервера не будут доступны через HTTP.")
 
+def log_pillow_simd_hint():
+    """Один раз при старте: подсказка, если установлен обычный Pillow, а не Pillow-SIMD (версии вида "9.5.0.post1")."""
+    import PIL
+    pillow_version = getattr(PIL, '__version__', '?')
+    if ".post" not in pillow_version:
+        print(f"[INFO] Pillow {pillow_version}: 'pip install pillow-simd' может ускорить отрисовку линий, paste и resize.")
+
 def main():
     """
     Главная функция сервера:
@@ -53,6 +60,8 @@ def main():
         print("В конфигурации не определено ни одного пайплайна. Завершение работы.")
         return
 
+    log_pillow_simd_hint()
+
     # Запуск HTTP сервера для метрик Prometheus самого сервера
     # Порт берется из глобальных настроек YAML или используется значение по умолчанию
     prometheus_exporter_port = global_settings.get('prometheus_exporter_port', 8000)
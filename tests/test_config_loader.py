@@ -0,0 +1,30 @@
+import unittest
+
+from config_loader import process_configs
+
+
+def _pipeline(name, port, **overrides):
+    conf = {'name': name, 'esp32_port': port, 'target_width': 320, 'target_height': 240,
+            'image_source_mode': 'PROMETHEUS_MONITOR'}
+    conf.update(overrides)
+    return conf
+
+
+class ProcessConfigsTest(unittest.TestCase):
+    def test_nested_overrides_do_not_leak_between_pipelines(self):
+        raw = {
+            'default_pipeline_settings': {'prometheus_metric_config': {'cpu': {'color': [1, 2, 3]}}},
+            'pipelines': [
+                _pipeline('a', 1, prometheus_metric_config={'ram': {'color': [4, 5, 6]}}),
+                _pipeline('b', 2),
+            ],
+        }
+        _, (first, second) = process_configs(raw)
+        self.assertEqual(first['prometheus_metric_config'], {'cpu': {'color': (1, 2, 3)}, 'ram': {'color': (4, 5, 6)}})
+        self.assertEqual(second['prometheus_metric_config'], {'cpu': {'color': (1, 2, 3)}})
+        # Conversion to tuples must not touch the raw defaults shared by all pipelines
+        self.assertEqual(raw['default_pipeline_settings'], {'prometheus_metric_config': {'cpu': {'color': [1, 2, 3]}}})
+
+
+if __name__ == '__main__':
+    unittest.main()
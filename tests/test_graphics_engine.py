@@ -0,0 +1,52 @@
+import math
+import random
+import unittest
+
+import numpy as np
+
+import graphics_engine
+from graphics_engine import HistoryBuffer, format_bytes, format_bytes_per_second
+
+
+class HistoryBufferTest(unittest.TestCase):
+    def test_int_history_saturates_non_finite_samples(self):
+        history = HistoryBuffer(4, dtype=np.int16, scale=100.0)
+        for value in (float('inf'), float('-inf'), float('nan'), 12.345):
+            history.append(value)
+        limits = np.iinfo(np.int16)
+        self.assertEqual(history.view().tolist(), [limits.max, limits.min, 0, 1234])
+
+    def test_float_history_keeps_non_finite_samples(self):
+        history = HistoryBuffer(3)
+        for value in (float('inf'), float('-inf'), float('nan')):
+            history.append(value)
+        values = history.values()
+        self.assertEqual(values[0], math.inf)
+        self.assertEqual(values[1], -math.inf)
+        self.assertTrue(math.isnan(values[2]))
+
+
+class FormatBytesCacheTest(unittest.TestCase):
+    def test_cached_output_matches_uncached_formatter(self):
+        uncached_bytes = graphics_engine._format_bytes_cached.__wrapped__
+        uncached_rate = graphics_engine._format_bytes_per_second_cached.__wrapped__
+        rng = random.Random(1234)
+        samples = [660.5048, 1057795543506, 819463574.68, 0, 1, 1.0, 1023, 1024, 1024.0]
+        samples += [rng.uniform(0, 10 ** rng.randint(0, 13)) for _ in range(20000)]
+        samples += [rng.randrange(10 ** rng.randint(1, 13)) for _ in range(5000)]
+        for precision in (0, 1, 2):
+            for value in samples:
+                # Cold and warm cache must both agree with the direct computation
+                for _ in range(2):
+                    self.assertEqual(format_bytes(value, precision), uncached_bytes(value, precision), (value, precision))
+                    self.assertEqual(format_bytes_per_second(value, precision), uncached_rate(value, precision), (value, precision))
+
+    def test_known_values(self):
+        self.assertEqual(format_bytes(660.5048, 0), '661 B')
+        self.assertEqual(format_bytes(1057795543506, 1), '985.1 GB')
+        self.assertEqual(format_bytes(819463574.68, 0), '782 MB')
+        self.assertEqual(format_bytes_per_second(1536, 1), '1.5KB/s')
+
+
+if __name__ == '__main__':
+    unittest.main()